@@ -0,0 +1,89 @@
+"""Admission control for the routes every student device polls.
+
+When a lecture hall's phones wake up together they all reload the topic page
+and restart their polling loops within the same second. Two checks keep such a
+burst from queueing in front of the teacher's requests:
+
+- a token bucket per client (the student's session, or else the client
+  address, whose bucket is sized for a classroom behind one NAT);
+- a budget of requests in flight, of which student requests may only use all
+  but ``teacher_reserve`` slots, so a teacher's click always finds one free.
+
+A shed request is told when to retry; the pages add jitter to that delay so
+the retries do not arrive as one burst again.
+"""
+
+from collections import OrderedDict
+from math import ceil
+from threading import Lock
+from time import monotonic
+
+TOO_MANY_REQUESTS = 429
+SERVICE_UNAVAILABLE = 503
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        rate: float,
+        burst: float,
+        max_in_flight: int,
+        teacher_reserve: int,
+        clients_per_address: int = 1,
+        max_clients: int = 100_000,
+        retry_seconds: int = 1,
+    ) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.max_in_flight = max_in_flight
+        self.student_in_flight = max(1, max_in_flight - teacher_reserve)
+        self.clients_per_address = max(1, clients_per_address)
+        self.max_clients = max_clients
+        self.retry_seconds = retry_seconds
+        self.in_flight = 0
+        # client key -> [tokens, refilled at]; least recently seen first.
+        self._buckets: OrderedDict[tuple[str, str], list[float]] = OrderedDict()
+        self._lock = Lock()
+
+    def admit(self, teacher: bool, student: str | None = None, address: str = "") -> tuple[int, int] | None:
+        """Admit a request, or return ``(status, retry_after_seconds)`` to shed it.
+
+        Teacher requests skip the per-client bucket and may use the whole
+        budget. Every admitted request must be paired with ``release()``.
+        """
+        with self._lock:
+            if self.in_flight >= (self.max_in_flight if teacher else self.student_in_flight):
+                return SERVICE_UNAVAILABLE, self.retry_seconds
+            if not teacher:
+                wait = self._take(("student", student) if student else ("address", address))
+                if wait:
+                    return TOO_MANY_REQUESTS, max(1, ceil(wait))
+            self.in_flight += 1
+            return None
+
+    def release(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+
+    def _take(self, key: tuple[str, str]) -> float:
+        """Take a token from ``key``'s bucket; return 0, or the seconds until one is due."""
+        scale = self.clients_per_address if key[0] == "address" else 1
+        rate, burst = self.rate * scale, self.burst * scale
+        now = monotonic()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [burst, now]
+            if len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+            bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+        if bucket[0] < 1:
+            return (1 - bucket[0]) / rate
+        bucket[0] -= 1
+        return 0.0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"in_flight": self.in_flight, "clients": len(self._buckets)}
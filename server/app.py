@@ -1,22 +1,150 @@
-from collections import Counter
+from bisect import bisect_left, bisect_right
+from collections.abc import AsyncIterator, Awaitable, Callable, Iterable, Iterator, Mapping
+from dataclasses import dataclass, replace
+from datetime import datetime, timezone
+import gzip
+import hashlib
+import heapq
 from pathlib import Path
 import os
-from threading import Lock
+import atexit
+import json
+import random
+import re
+import secrets
+from multiprocessing.managers import BaseManager
+import signal
+import sys
+from threading import Event, Lock, Thread, current_thread, main_thread
+from time import monotonic, perf_counter, sleep
+from types import MappingProxyType
 from uuid import UUID
 
-from flask import Flask, abort, jsonify, redirect, render_template, request, session
-import yaml
+import click
+from jinja2.utils import htmlsafe_json_dumps
+from markupsafe import Markup, escape
+from flask import Flask, Response, abort, g, jsonify, redirect, render_template, request, session
+
+try:
+    import brotli
+except ImportError:  # optional: responses fall back to gzip
+    brotli = None
+
+from admission import AdmissionController
+from catalog import CatalogError, compile_poll_source, default_cache_path
+from export import EXPORT_FORMATS, encode_chunks, gzip_chunks
+from metrics import SIZE_BUCKETS, MetricsRegistry, TimedLock
+from profiler import SamplingProfiler
+from results import (
+    RUN_EVICTION_INTERVAL_SECONDS,
+    ResultStore,
+    SharedResultStore,
+    SubmissionIngestor,
+    build_topic_key,
+    decode_answer,
+    intern_poll,
+    option_positions,
+    parse_poll_reference,
+    poll_path,
+)
+from storage import open_results_storage
 
 app = Flask(__name__)
 app.secret_key = os.getenv("FLASK_SECRET_KEY", "9430e003-162c-4f85-aac0-408211a62f01")
+# Pages subscribe to event streams only when the server can hold them cheaply
+# (asgi.py turns this on); a stream served here would hold a thread per open page.
+app.config["EVENT_STREAMS"] = os.getenv("EVENT_STREAMS", "0") == "1"
 
 DEFAULT_POLL_FILE = Path(__file__).resolve().parent.parent / "polls.yml"
 POLL_FILE = Path(os.getenv("POLL_FILE", str(DEFAULT_POLL_FILE)))
-RESULTS_LOCK = Lock()
-POLL_RESULTS: dict[str, dict] = {}
-TOPIC_SELECTION_LOCK = Lock()
-ACTIVE_TOPIC_POLL: dict[str, str] = {}
+# Compiled catalog cache: unset means next to POLL_FILE, empty turns it off.
+POLL_CACHE = os.getenv("POLL_CACHE")
+POLL_RELOAD_SECONDS = float(os.getenv("POLL_RELOAD_SECONDS", "1.0"))
+POLL_CATALOG_LOCK = Lock()
+RESULT_SHARD_COUNT = max(1, int(os.getenv("RESULT_SHARDS", "64")))
+DEFAULT_RESULTS_DB = Path(__file__).resolve().parent.parent / "data" / "results.sqlite3"
+RESULTS_STORAGE_SPEC = os.getenv("RESULTS_STORAGE", f"sqlite:{DEFAULT_RESULTS_DB}")
+RESULTS_SNAPSHOT_SECONDS = float(os.getenv("RESULTS_SNAPSHOT_SECONDS", "300"))
+RUN_IDLE_SECONDS = float(os.getenv("RUN_IDLE_SECONDS", str(12 * 60 * 60)))
+DEFAULT_SHARED_STATE_ADDRESS = "/tmp/tellme-state.sock"
+SHARED_STATE_ADDRESS = os.getenv("SHARED_STATE_ADDRESS")
+# Guards a socket that unpickles what it receives, so there is no default.
+SHARED_STATE_AUTHKEY = os.getenv("SHARED_STATE_AUTHKEY", "").encode("utf-8")
+SHARED_STATE_POLL_SECONDS = 1.0
+SUBMISSION_INGEST = os.getenv("SUBMISSION_INGEST", "batched")
+STUDENT_LEDGER = os.getenv("STUDENT_LEDGER", "server")
+# (catalog digest, {(subject, topic, poll, language): compiled student page})
+POLL_PAGES: tuple[str, dict[tuple[str, str, str, str], "CompiledPage"]] = ("", {})
+# run id -> poll path -> (entry version, catalog digest, rendered payload)
+RESULT_PAYLOADS: dict[str, dict[tuple[str, str, str], tuple[int, str, dict]]] = {}
+RESULT_PAYLOADS_USED: dict[str, float] = {}
+RESULT_PAYLOADS_PRUNED = 0.0
 SUPPORTED_LOCALES = ("de", "it", "en")
+SSE_HEARTBEAT_SECONDS = 15.0
+EXPORT_BATCH_RUNS = 50
+RESULTS_PAGE_SIZE = 50
+RESULTS_MAX_PAGE_SIZE = 200
+ROLLUP_BUCKET_SECONDS = int(os.getenv("ROLLUP_BUCKET_SECONDS", str(24 * 60 * 60)))
+# Per-second answer counts kept for each poll of a run, and the sparkline they are sent as.
+TIMELINE_SECONDS = max(1, int(os.getenv("TIMELINE_SECONDS", "120")))
+TIMELINE_POINTS = 60
+TIMELINE_SHARE = 0.8
+SSE_COALESCE_SECONDS = 0.5
+SSE_RETRY_MILLISECONDS = 2000
+LOCK_METRICS = os.getenv("LOCK_METRICS", "1") == "1"
+ADMISSION_CONTROL = os.getenv("ADMISSION_CONTROL", "1") == "1"
+# Requests per second (and burst) one student may make to the admitted routes.
+ADMISSION_RATE = float(os.getenv("ADMISSION_RATE", "2"))
+ADMISSION_BURST = float(os.getenv("ADMISSION_BURST", "8"))
+# Students without a session are counted per address; one address may be a whole classroom's NAT.
+ADMISSION_CLIENTS_PER_ADDRESS = int(os.getenv("ADMISSION_CLIENTS_PER_ADDRESS", "60"))
+ADMISSION_MAX_IN_FLIGHT = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", "32"))
+ADMISSION_TEACHER_RESERVE = int(os.getenv("ADMISSION_TEACHER_RESERVE", "4"))
+# Endpoints under admission control, and whether they are a teacher's (prioritized).
+ADMISSION_ENDPOINTS = {
+    "topic_entry": False,
+    "student_topic_active_api": False,
+    "teacher_topic_results_api": True,
+    "teacher_topic_active_api": True,
+    "student_topic_events_api": False,
+    "teacher_topic_events_api": True,
+}
+PROFILING = os.getenv("PROFILING", "0") == "1"
+
+METRICS = MetricsRegistry()
+REQUEST_COUNT = METRICS.counter(
+    "tellme_http_requests_total", "HTTP requests by route, method and status.", ("route", "method", "status")
+)
+REQUEST_LATENCY = METRICS.histogram(
+    "tellme_http_request_duration_seconds",
+    "Time to build a response, by route (for event streams, until streaming starts).",
+    ("route",),
+)
+RESPONSE_SIZE = METRICS.histogram(
+    "tellme_http_response_bytes", "Body size of non-streamed responses, by route.", ("route",), buckets=SIZE_BUCKETS
+)
+SSE_FRAME_SIZE = METRICS.histogram(
+    "tellme_sse_frame_bytes", "Size of server-sent event frames, by event.", ("event",), buckets=SIZE_BUCKETS
+)
+CATALOG_LOOKUPS = METRICS.counter(
+    "tellme_poll_catalog_lookups_total",
+    "Catalog checks: hit (file unchanged), unchanged (touched, same content), parsed, cached (compiled cache)"
+    " or rejected (invalid, previous catalog kept).",
+    ("result",),
+)
+CATALOG_PARSE_TIME = METRICS.histogram("tellme_poll_catalog_parse_seconds", "Time to compile and index polls.yml.")
+LOCK_BUCKETS = (0.000001, 0.00001, 0.0001, 0.001, 0.01, 0.1, 1.0)
+LOCK_WAIT = METRICS.histogram(
+    "tellme_lock_wait_seconds", "Time spent waiting for results store locks.", ("lock",), buckets=LOCK_BUCKETS
+)
+LOCK_HOLD = METRICS.histogram(
+    "tellme_lock_hold_seconds", "Time results store locks were held.", ("lock",), buckets=LOCK_BUCKETS
+)
+SUBMISSIONS = METRICS.counter("tellme_submissions_total", "Accepted student submissions.")
+ADMISSION_SHED = METRICS.counter(
+    "tellme_admission_shed_total", "Requests turned away by admission control, by route and status.", ("route", "status")
+)
+PROFILER = SamplingProfiler()
 
 MESSAGES = {
     "already_submitted": {
@@ -132,6 +260,16 @@ UI_TEXTS = {
         "de": "Live-Ergebnisse konnten nicht geladen werden.",
         "it": "Impossibile caricare i risultati live.",
     },
+    "teacher_time_to_share": {
+        "en": "{share}% of answers within {seconds}s",
+        "de": "{share}% der Antworten nach {seconds}s",
+        "it": "{share}% delle risposte entro {seconds}s",
+    },
+    "busy_retrying": {
+        "en": "Lots of requests right now. This page tries again in a moment.",
+        "de": "Gerade kommen sehr viele Anfragen an. Die Seite versucht es gleich noch einmal.",
+        "it": "Troppe richieste in questo momento. La pagina riprova tra un attimo.",
+    },
 }
 
 def normalize_language(language: str | None) -> str:
@@ -147,17 +285,111 @@ def msg(message_key: str, locale: str = "en", **kwargs) -> str:
     return template.format(**kwargs)
 
 
+def build_ui_text_tables() -> dict[str, dict[str, str]]:
+    return {
+        locale: {key: variants.get(locale) or variants.get("en") or key for key, variants in UI_TEXTS.items()}
+        for locale in SUPPORTED_LOCALES
+    }
+
+
+# Built once at import; the tables are shared between requests, so treat them as read-only.
+UI_TEXT_TABLES = build_ui_text_tables()
+
+
 def ui_texts(locale: str = "en") -> dict[str, str]:
-    localized = {}
-    for key, variants in UI_TEXTS.items():
-        localized[key] = variants.get(locale) or variants.get("en") or key
-    return localized
+    return UI_TEXT_TABLES.get(locale) or UI_TEXT_TABLES["en"]
+
+
+@dataclass(frozen=True)
+class CompiledPage:
+    """A rendered page split around its slots: ``literals[i]`` precedes ``slots[i]``.
+
+    Slots are ``(name,)`` for a value passed to ``fill`` or ``("choice",
+    position, if_selected, otherwise)`` for markup that depends on whether an
+    option is selected.
+    """
+
+    literals: tuple[str, ...]
+    slots: tuple[tuple, ...]
+
+    def fill(self, values: Mapping[str, str], selected_positions: set[int]) -> str:
+        parts = [self.literals[0]]
+        for (name, *args), literal in zip(self.slots, self.literals[1:]):
+            if name == "choice":
+                position, if_selected, otherwise = args
+                parts.append(if_selected if position in selected_positions else otherwise)
+            else:
+                parts.append(values[name])
+            parts.append(literal)
+        return "".join(parts)
+
+
+def compile_page(template_name: str, **context) -> CompiledPage:
+    """Render a template once, leaving a hole wherever it calls ``slot(...)``.
+
+    Holes are marked with a tag named by a fresh random token. Escaped values
+    cannot contain ``<``, so poll text never looks like a hole.
+    """
+    slots = []
+    marker = f"slot-{secrets.token_hex(8)}"
+
+    def slot(*args) -> Markup:
+        slots.append(args)
+        return Markup(f"<{marker}:{len(slots) - 1}>")
+
+    parts = re.split(f"<{marker}:(\\d+)>", render_template(template_name, slot=slot, **context))
+    return CompiledPage(
+        literals=tuple(parts[0::2]),
+        slots=tuple(slots[int(index)] for index in parts[1::2]),
+    )
+
+
+@dataclass(frozen=True)
+class PollCatalog:
+    """Immutable snapshot of the parsed poll file.
+
+    Snapshots are never mutated after construction, so request handlers can keep
+    using the one they fetched even if the file is reloaded concurrently.
+    """
+
+    signature: tuple[int, int]
+    digest: str
+    polls_by_path: Mapping[tuple[str, str, str], Mapping]
+    subject_languages: Mapping[str, str]
+    topic_poll_ids: Mapping[tuple[str, str], tuple[str, ...]]
+    # Every path in sorted order, and each path's position in it.
+    sorted_paths: tuple[tuple[str, str, str], ...]
+    path_positions: Mapping[tuple[str, str, str], int]
 
+    def scope_range(self, subject_id: str | None = None, topic_id: str | None = None) -> tuple[int, int]:
+        """Positions ``[start, end)`` of the polls of a subject or topic in ``sorted_paths``.
 
-def load_polls() -> dict[tuple[str, str, str], dict]:
-    with POLL_FILE.open("r", encoding="utf-8") as handle:
-        data = yaml.safe_load(handle) or {}
+        Sorting keeps each subject and each topic contiguous, so this is two bisections.
+        """
+        if subject_id is None:
+            return 0, len(self.sorted_paths)
+        prefix = (subject_id,) if topic_id is None else (subject_id, topic_id)
+        # "\0" appended gives the smallest string sorting after the last element.
+        return (
+            bisect_left(self.sorted_paths, prefix),
+            bisect_left(self.sorted_paths, (*prefix[:-1], prefix[-1] + "\0")),
+        )
 
+
+POLL_CATALOG: PollCatalog | None = None
+# Signature of the last file that failed to compile, so it is not retried until it changes.
+POLL_CATALOG_REJECTED: tuple[int, int] | None = None
+
+
+def freeze(value):
+    if isinstance(value, dict):
+        return MappingProxyType({key: freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+def parse_polls(data: dict) -> dict[tuple[str, str, str], dict]:
     flattened_polls = []
 
     # Backward-compatible: allow a flat top-level "polls" list.
@@ -196,6 +428,104 @@ def load_polls() -> dict[tuple[str, str, str], dict]:
     return polls_by_path
 
 
+def build_poll_catalog(data: dict, signature: tuple[int, int], digest: str) -> PollCatalog:
+    polls_by_path = {key: freeze(poll) for key, poll in parse_polls(data).items()}
+    for key in polls_by_path:
+        intern_poll(key)
+
+    # Index the flat mapping once so topic-scoped lookups never scan the catalog.
+    subject_languages: dict[str, str] = {}
+    topic_poll_ids: dict[tuple[str, str], list[str]] = {}
+    for (subject_id, topic_id, poll_id), poll in polls_by_path.items():
+        subject_languages.setdefault(subject_id, normalize_language(poll.get("language")))
+        topic_poll_ids.setdefault((subject_id, topic_id), []).append(poll_id)
+    sorted_paths = tuple(sorted(polls_by_path))
+
+    return PollCatalog(
+        signature=signature,
+        digest=digest,
+        polls_by_path=MappingProxyType(polls_by_path),
+        subject_languages=MappingProxyType(subject_languages),
+        topic_poll_ids=MappingProxyType(
+            {topic: tuple(poll_ids) for topic, poll_ids in topic_poll_ids.items()}
+        ),
+        sorted_paths=sorted_paths,
+        path_positions=MappingProxyType({path: position for position, path in enumerate(sorted_paths)}),
+    )
+
+
+def get_poll_catalog() -> PollCatalog:
+    """Return the current catalog.
+
+    Requests never compile: the catalog is built at startup and replaced by
+    the reload thread, so this only reads a global.
+    """
+    catalog = POLL_CATALOG
+    if catalog is None:
+        return reload_poll_catalog()
+    return catalog
+
+
+def poll_cache_path() -> Path | None:
+    if POLL_CACHE is None:
+        return default_cache_path(POLL_FILE)
+    return Path(POLL_CACHE) if POLL_CACHE else None
+
+
+def reload_poll_catalog() -> PollCatalog:
+    """Compile POLL_FILE if it changed and swap the new catalog in.
+
+    A cheap stat() decides whether the file may have changed; the content hash
+    then avoids a re-compile when only the mtime was touched. A file that does
+    not validate leaves the current catalog in place; with no catalog yet, its
+    CatalogError is raised.
+    """
+    global POLL_CATALOG, POLL_CATALOG_REJECTED
+    with POLL_CATALOG_LOCK:
+        stat = POLL_FILE.stat()
+        signature = (stat.st_mtime_ns, stat.st_size)
+        catalog = POLL_CATALOG
+        if catalog is not None and signature in (catalog.signature, POLL_CATALOG_REJECTED):
+            CATALOG_LOOKUPS.inc("hit")
+            return catalog
+
+        raw = POLL_FILE.read_bytes()
+        if catalog is not None and catalog.digest == hashlib.sha256(raw).hexdigest():
+            CATALOG_LOOKUPS.inc("unchanged")
+            POLL_CATALOG = replace(catalog, signature=signature)
+            return POLL_CATALOG
+
+        started = perf_counter()
+        try:
+            digest, data, from_cache = compile_poll_source(raw, poll_cache_path())
+        except CatalogError as error:
+            if catalog is None:
+                raise
+            CATALOG_LOOKUPS.inc("rejected")
+            POLL_CATALOG_REJECTED = signature
+            app.logger.error("Keeping the current polls: %s %s", POLL_FILE, error)
+            return catalog
+        catalog = build_poll_catalog(data, signature, digest)
+        CATALOG_PARSE_TIME.observe(perf_counter() - started)
+        CATALOG_LOOKUPS.inc("cached" if from_cache else "parsed")
+        # Requests holding the old snapshot finish with it; new ones get this one.
+        POLL_CATALOG = catalog
+        return catalog
+
+
+def watch_poll_catalog() -> None:
+    while True:
+        sleep(POLL_RELOAD_SECONDS)
+        try:
+            reload_poll_catalog()
+        except OSError as error:
+            app.logger.error("Could not read %s: %s", POLL_FILE, error)
+
+
+def load_polls() -> Mapping[tuple[str, str, str], Mapping]:
+    return get_poll_catalog().polls_by_path
+
+
 def get_run_id_or_404() -> str:
     raw_id = request.args.get("id", "")
     try:
@@ -208,259 +538,874 @@ def build_submission_key(run_id: str, subject_id: str, topic_id: str, poll_id: s
     return f"{run_id}|{subject_id}/{topic_id}/{poll_id}"
 
 
-def build_topic_key(run_id: str, subject_id: str, topic_id: str) -> str:
-    return f"{run_id}|{subject_id}/{topic_id}"
+class TopicEventHub:
+    """Per-topic change notifications for streaming clients in this process.
 
+    Listeners are plain callables rather than blocked threads, so the hub works
+    equally for WSGI generators (``threading.Event.set``) and asyncio servers
+    (``loop.call_soon_threadsafe``). Topics without listeners cost nothing.
+    Listeners re-read the store when notified; the hub carries no state.
+    """
 
-def get_topic_poll_ids(subject_id: str, topic_id: str) -> list[str]:
-    polls_by_path = load_polls()
-    poll_ids = []
-    for current_subject, current_topic, poll_id in polls_by_path:
-        if current_subject == subject_id and current_topic == topic_id:
-            poll_ids.append(poll_id)
-    return poll_ids
+    def __init__(self) -> None:
+        self._lock = Lock()
+        self._listeners: dict[str, set[Callable[[], None]]] = {}
+
+    def subscribe(self, topic_key: str, notify: Callable[[], None]) -> None:
+        with self._lock:
+            self._listeners.setdefault(topic_key, set()).add(notify)
+
+    def unsubscribe(self, topic_key: str, notify: Callable[[], None]) -> None:
+        with self._lock:
+            listeners = self._listeners.get(topic_key)
+            if listeners is None:
+                return
+            listeners.discard(notify)
+            if not listeners:
+                self._listeners.pop(topic_key, None)
+
+    def publish(self, topic_key: str) -> None:
+        with self._lock:
+            listeners = list(self._listeners.get(topic_key, ()))
+        for notify in listeners:
+            notify()
+
+
+EVENT_HUB = TopicEventHub()
+
+
+def make_store_lock(name: str) -> "Lock | TimedLock":
+    return TimedLock(name, LOCK_WAIT, LOCK_HOLD) if LOCK_METRICS else Lock()
+
+
+def get_topic_poll_ids(subject_id: str, topic_id: str) -> tuple[str, ...]:
+    return get_poll_catalog().topic_poll_ids.get((subject_id, topic_id), ())
 
 
 def get_active_topic_poll(run_id: str, subject_id: str, topic_id: str) -> str | None:
-    topic_key = build_topic_key(run_id, subject_id, topic_id)
-    with TOPIC_SELECTION_LOCK:
-        return ACTIVE_TOPIC_POLL.get(topic_key)
+    return get_active_topic_state(run_id, subject_id, topic_id)[0]
+
+
+def get_active_topic_state(run_id: str, subject_id: str, topic_id: str) -> tuple[str | None, int]:
+    """Return the active poll and selection version of a topic.
+
+    Until the teacher picks a poll (or when the picked poll left the catalog),
+    the topic's first poll is active. That default is not stored, so looking at
+    a topic never creates a run.
+    """
+    poll_id, version = RESULT_STORE.get_selection(run_id, build_topic_key(run_id, subject_id, topic_id))
+    return resolve_active_poll(poll_id, get_topic_poll_ids(subject_id, topic_id)), version
+
+
+def resolve_active_poll(poll_id: str | None, poll_ids: tuple[str, ...]) -> str | None:
+    # See get_active_topic_state.
+    if poll_id not in poll_ids:
+        poll_id = poll_ids[0] if poll_ids else None
+    return poll_id
+
+
+def get_active_topic_answer(
+    run_id: str, subject_id: str, topic_id: str, student: str | None
+) -> tuple[str | None, str | list[str] | None]:
+    """Return the active poll of a topic and ``student``'s answer to it from the ledger.
+
+    Both come from one store call, so a student page costs one round trip to
+    a shared store.
+    """
+    poll_ids = get_topic_poll_ids(subject_id, topic_id)
+    paths = [(subject_id, topic_id, poll_id) for poll_id in poll_ids]
+    selected, _, answers = RESULT_STORE.read_student(
+        run_id, build_topic_key(run_id, subject_id, topic_id), student, paths
+    )
+    active_poll_id = resolve_active_poll(selected, poll_ids)
+    if active_poll_id is None:
+        return None, None
+    poll = load_polls()[(subject_id, topic_id, active_poll_id)]
+    return active_poll_id, decode_answer(poll, answers[poll_ids.index(active_poll_id)])
 
 
 def set_active_topic_poll(run_id: str, subject_id: str, topic_id: str, poll_id: str) -> bool:
     if poll_id not in get_topic_poll_ids(subject_id, topic_id):
         return False
-    topic_key = build_topic_key(run_id, subject_id, topic_id)
-    with TOPIC_SELECTION_LOCK:
-        ACTIVE_TOPIC_POLL[topic_key] = poll_id
+    if RESULT_STORE.set_selection(run_id, subject_id, topic_id, poll_id):
+        EVENT_HUB.publish(build_topic_key(run_id, subject_id, topic_id))
     return True
 
 
-def ensure_active_topic_poll(run_id: str, subject_id: str, topic_id: str) -> str | None:
-    poll_ids = get_topic_poll_ids(subject_id, topic_id)
-    if not poll_ids:
-        return None
+def open_result_store() -> ResultStore | SharedResultStore:
+    if SHARED_STATE_ADDRESS:
+        if not SHARED_STATE_AUTHKEY:
+            raise RuntimeError("SHARED_STATE_ADDRESS needs SHARED_STATE_AUTHKEY set to the state server's key")
+        return SharedResultStore(SHARED_STATE_ADDRESS, SHARED_STATE_AUTHKEY)
+    return ResultStore(
+        RESULT_SHARD_COUNT,
+        open_results_storage(RESULTS_STORAGE_SPEC),
+        load_polls,
+        idle_seconds=RUN_IDLE_SECONDS,
+        snapshot_seconds=RESULTS_SNAPSHOT_SECONDS,
+        rollup_bucket_seconds=ROLLUP_BUCKET_SECONDS,
+        timeline_seconds=TIMELINE_SECONDS,
+        make_lock=make_store_lock,
+    )
 
-    current = get_active_topic_poll(run_id, subject_id, topic_id)
-    if current in poll_ids:
-        return current
 
-    first_poll_id = poll_ids[0]
-    set_active_topic_poll(run_id, subject_id, topic_id, first_poll_id)
-    return first_poll_id
+RESULT_STORE = open_result_store()
 
 
-def ensure_result_entry(submission_key: str, poll: dict) -> dict:
-    entry = POLL_RESULTS.get(submission_key)
-    if entry is None:
-        entry = {
-            "answer_type": poll.get("answer_type"),
-            "counts": {},
-            "text_counts": {},
-            "response_count": 0,
-        }
-        POLL_RESULTS[submission_key] = entry
-    else:
-        # Backward compatibility for older in-memory format.
-        if "text_counts" not in entry:
-            legacy_answers = entry.get("answers", [])
-            text_counter: Counter[str] = Counter()
-            for answer in legacy_answers:
-                if answer:
-                    text_counter[answer] += 1
-            entry["text_counts"] = dict(text_counter)
-            entry.pop("answers", None)
+def record_submission(
+    run_id: str,
+    poll: Mapping,
+    submitted_answer: str | list[str],
+    previous_answer: str | list[str] | None = None,
+    student: str | None = None,
+) -> bool:
+    return RESULT_STORE.record(run_id, poll, submitted_answer, previous_answer, student)
 
-    if poll.get("answer_type") in {"single_choice", "multiple_choice"}:
-        for answer in poll.get("answers", []):
-            entry["counts"].setdefault(answer, 0)
 
-    return entry
+def record_submission_batch(submissions: list[tuple]) -> list[bool]:
+    return RESULT_STORE.record_batch(submissions)
 
 
-def record_submission(
-    submission_key: str,
-    poll: dict,
+SUBMISSION_INGESTOR = (
+    SubmissionIngestor(record_submission_batch, EVENT_HUB.publish) if SUBMISSION_INGEST == "batched" else None
+)
+
+
+def ingest_submission(
+    run_id: str,
+    subject_id: str,
+    topic_id: str,
+    poll: Mapping,
     submitted_answer: str | list[str],
     previous_answer: str | list[str] | None = None,
+    student: str | None = None,
 ) -> None:
-    with RESULTS_LOCK:
-        entry = ensure_result_entry(submission_key, poll)
-        answer_type = poll.get("answer_type")
-        if answer_type == "single_choice":
-            if not isinstance(submitted_answer, str):
-                return
-            if (
-                isinstance(previous_answer, str)
-                and previous_answer in entry["counts"]
-                and entry["counts"][previous_answer] > 0
-            ):
-                entry["counts"][previous_answer] -= 1
-            if submitted_answer in entry["counts"]:
-                entry["counts"][submitted_answer] += 1
-        elif answer_type == "multiple_choice":
-            previous_choices = previous_answer if isinstance(previous_answer, list) else []
-            current_choices = submitted_answer if isinstance(submitted_answer, list) else []
-            previous_set = set(previous_choices)
-            current_set = set(current_choices)
-
-            if not previous_set and current_set:
-                entry["response_count"] += 1
-            elif previous_set and not current_set and entry["response_count"] > 0:
-                entry["response_count"] -= 1
-
-            for choice in previous_set:
-                if choice in entry["counts"] and entry["counts"][choice] > 0:
-                    entry["counts"][choice] -= 1
-            for choice in current_set:
-                if choice in entry["counts"]:
-                    entry["counts"][choice] += 1
-        elif answer_type == "text":
-            if not isinstance(submitted_answer, str):
-                return
-            text_counts = entry["text_counts"]
-            if (
-                isinstance(previous_answer, str)
-                and previous_answer in text_counts
-                and text_counts[previous_answer] > 0
-            ):
-                text_counts[previous_answer] -= 1
-                if text_counts[previous_answer] == 0:
-                    text_counts.pop(previous_answer, None)
-            text_counts[submitted_answer] = text_counts.get(submitted_answer, 0) + 1
-
-
-def compute_term_frequencies(answer_counts: dict[str, int]) -> list[tuple[str, int]]:
-    counter: Counter[str] = Counter()
-    for answer, occurrences in answer_counts.items():
-        normalized_answer = answer.strip()
-        if occurrences <= 0 or not normalized_answer:
-            continue
-        counter[normalized_answer] += occurrences
-    return counter.most_common(40)
-
-
-def build_teacher_results(run_id: str) -> list[dict]:
-    polls_by_path = load_polls()
+    submission = (run_id, poll, submitted_answer, previous_answer, student)
+    SUBMISSIONS.inc()
+    if SUBMISSION_INGESTOR is not None:
+        SUBMISSION_INGESTOR.submit(run_id, subject_id, topic_id, submission)
+    elif record_submission(*submission):
+        EVENT_HUB.publish(build_topic_key(run_id, subject_id, topic_id))
+
+
+def build_poll_result(subject_id: str, topic_id: str, poll_id: str, poll: Mapping, entry: dict) -> dict:
+    answer_type = poll.get("answer_type")
+    base_data = {
+        "subject": subject_id,
+        "topic": topic_id,
+        "poll_id": poll_id,
+        "question": poll.get("question", poll_id),
+        "answer_type": answer_type,
+        "path": f"/{subject_id}/{topic_id}/{poll_id}",
+        "language": poll.get("language", "en"),
+        "version": entry["version"],
+    }
+    if entry.get("timeline") is not None:
+        base_data["timeline"] = entry["timeline"].summary(TIMELINE_POINTS, TIMELINE_SHARE)
+
+    if answer_type in {"single_choice", "multiple_choice"}:
+        counts = entry["counts"]
+        total = sum(counts) if answer_type == "single_choice" else entry["response_count"]
+        options = []
+        for position, answer in enumerate(poll.get("answers", [])):
+            count = counts[position] if position < len(counts) else 0
+            percentage = round((count / total) * 100, 1) if total else 0.0
+            options.append(
+                {
+                    "label": answer,
+                    "count": count,
+                    "percentage": percentage,
+                }
+            )
+        return {
+            **base_data,
+            "total_responses": total,
+            "options": options,
+        }
+    if answer_type == "text":
+        terms = [{"term": term, "count": count} for term, count in entry["terms"]]
+        return {
+            **base_data,
+            "total_responses": entry["response_count"],
+            "terms": terms,
+        }
+    return {**base_data, "total_responses": 0}
+
+
+def build_results(run_id: str, catalog: PollCatalog, poll_keys: Iterable[tuple[str, str, str]]) -> list[dict]:
+    """Return teacher payloads for ``poll_keys``, re-rendering only changed polls.
+
+    Rendered payloads are cached together with the entry version they were
+    built from; the store skips copying entries that are still at that version.
+    """
+    poll_keys = list(poll_keys)
+    requests = build_result_requests(run_id, catalog, poll_keys)
+    return render_results(run_id, catalog, poll_keys, RESULT_STORE.read_entries(run_id, requests))
+
+
+def build_result_requests(
+    run_id: str, catalog: PollCatalog, poll_keys: list[tuple[str, str, str]]
+) -> list[tuple[Mapping, int | None]]:
+    """``(poll, known_version)`` store requests, with the versions of the payloads cached for ``run_id``."""
+    cached_payloads = RESULT_PAYLOADS.get(run_id, {})
+    requests = []
+    for poll_key in poll_keys:
+        cached = cached_payloads.get(poll_key)
+        known_version = cached[0] if cached is not None and cached[1] == catalog.digest else None
+        requests.append((catalog.polls_by_path[poll_key], known_version))
+    return requests
+
+
+def render_results(
+    run_id: str, catalog: PollCatalog, poll_keys: list[tuple[str, str, str]], entries: list[dict | None]
+) -> list[dict]:
+    # ``entries`` answer the requests of ``build_result_requests``; None reuses the cached payload.
+    cached_payloads = RESULT_PAYLOADS.get(run_id, {})
     payload = []
+    for poll_key, entry in zip(poll_keys, entries):
+        if entry is None:
+            payload.append(cached_payloads[poll_key][2])
+            continue
+        subject_id, topic_id, poll_id = poll_key
+        result = build_poll_result(subject_id, topic_id, poll_id, catalog.polls_by_path[poll_key], entry)
+        if entry["version"]:
+            # Unanswered polls are cheap to render; caching them would let any
+            # made-up run id grow this cache.
+            RESULT_PAYLOADS.setdefault(run_id, cached_payloads)[poll_key] = (entry["version"], catalog.digest, result)
+        payload.append(result)
+    if run_id in RESULT_PAYLOADS:
+        RESULT_PAYLOADS_USED[run_id] = monotonic()
+        prune_result_payloads()
+    return payload
 
-    with RESULTS_LOCK:
-        for (subject_id, topic_id, poll_id), poll in sorted(polls_by_path.items()):
-            submission_key = build_submission_key(run_id, subject_id, topic_id, poll_id)
-            entry = ensure_result_entry(submission_key, poll)
-            answer_type = poll.get("answer_type")
 
-            base_data = {
+def prune_result_payloads() -> None:
+    """Forget cached payloads of runs nobody asked about for RUN_IDLE_SECONDS."""
+    global RESULT_PAYLOADS_PRUNED
+    now = monotonic()
+    if not RUN_IDLE_SECONDS or now - RESULT_PAYLOADS_PRUNED < RUN_EVICTION_INTERVAL_SECONDS:
+        return
+    RESULT_PAYLOADS_PRUNED = now
+    for run_id, used in list(RESULT_PAYLOADS_USED.items()):
+        if now - used > RUN_IDLE_SECONDS:
+            RESULT_PAYLOADS.pop(run_id, None)
+            RESULT_PAYLOADS_USED.pop(run_id, None)
+
+
+def fingerprint_etag(*parts: object) -> str:
+    return hashlib.blake2b(repr(parts).encode("utf-8"), digest_size=12).hexdigest()
+
+
+def compact_poll_result(result: dict) -> dict:
+    """Counts-only form of a poll result for deltas; labels and percentages are already on the client."""
+    delta = {
+        "path": result["path"],
+        "poll_id": result["poll_id"],
+        "version": result["version"],
+        "total_responses": result["total_responses"],
+    }
+    if "options" in result:
+        delta["counts"] = [option["count"] for option in result["options"]]
+    if "terms" in result:
+        delta["terms"] = [[term["term"], term["count"]] for term in result["terms"]]
+    if "timeline" in result:
+        delta["timeline"] = result["timeline"]
+    return delta
+
+
+@dataclass(frozen=True)
+class TopicResults:
+    """What a teacher topic results request reads, from one store call.
+
+    ``etag`` is known before anything is rendered, so an unchanged dashboard
+    gets its 304 without building ``payload()``.
+    """
+
+    run_id: str
+    catalog: PollCatalog
+    poll_keys: list[tuple[str, str, str]]
+    known_version: int
+    active_poll_id: str | None
+    active_version: int
+    etag: str
+    read: dict
+
+    def payload(self) -> dict:
+        """Results as ``{"version", "full", "polls", "active_poll_id"}``.
+
+        ``version`` is an opaque cursor: the run version plus the catalog digest.
+        Given a ``since`` cursor from the same catalog, only the polls that changed
+        after it are returned, in ``compact_poll_result`` form; otherwise (no
+        cursor, a reloaded catalog or a cursor from the future) everything is.
+        """
+        run_version = self.read["run_version"]
+        cursor = f"{run_version}.{self.catalog.digest[:8]}"
+        full = self.known_version < 0 or self.known_version > run_version
+        poll_keys = self.poll_keys if full else [tuple(path) for path in self.read["changed"]]
+        polls = render_results(self.run_id, self.catalog, poll_keys, self.read["entries"])
+        if not full:
+            polls = [compact_poll_result(result) for result in polls]
+        return {"version": cursor, "full": full, "polls": polls, "active_poll_id": self.active_poll_id}
+
+
+def read_topic_results(
+    run_id: str, catalog: PollCatalog, subject_id: str, topic_id: str, since: str | None
+) -> TopicResults | None:
+    """Read a topic's selection, versions and changed entries in one store call; None for unknown topics."""
+    poll_ids = catalog.topic_poll_ids.get((subject_id, topic_id), ())
+    if not poll_ids:
+        return None
+    poll_keys = [(subject_id, topic_id, poll_id) for poll_id in poll_ids]
+    known_version = parse_results_cursor(since, catalog)
+    read = RESULT_STORE.read_topic(
+        run_id,
+        build_topic_key(run_id, subject_id, topic_id),
+        build_result_requests(run_id, catalog, poll_keys),
+        known_version,
+    )
+    selected, active_version = read["selection"]
+    active_poll_id = resolve_active_poll(selected, poll_ids)
+    etag = fingerprint_etag(catalog.digest, read["versions"], (active_poll_id, active_version, since))
+    return TopicResults(run_id, catalog, poll_keys, known_version, active_poll_id, active_version, etag, read)
+
+
+def parse_results_cursor(since: str | None, catalog: PollCatalog) -> int:
+    """Run version of a ``since`` cursor from this catalog, or -1 if it is missing or stale."""
+    since_version, _, since_digest = (since or "").partition(".")
+    if since_version.isdigit() and since_digest == catalog.digest[:8]:
+        return int(since_version)
+    return -1
+
+
+def select_results_page(
+    run_id: str,
+    catalog: PollCatalog,
+    start: int,
+    end: int,
+    after: str | None,
+    limit: int,
+    known_version: int,
+) -> tuple[int, bool, list[tuple[str, str, str]], str | None]:
+    """Pick the next page of a run's answered polls between catalog positions ``start`` and ``end``.
+
+    Returns ``(run_version, full, page, next_cursor)``. With a usable
+    ``known_version`` only polls changed after it are picked. Polls nobody
+    answered are never visited: the store lists the run's own entries and
+    their catalog positions select the page, so the cost follows the run and
+    the page size rather than the catalog.
+    """
+    run_version, touched = RESULT_STORE.touched(run_id, known_version if known_version >= 0 else None)
+    full = known_version < 0 or known_version > run_version
+    if full and known_version >= 0:
+        run_version, touched = RESULT_STORE.touched(run_id)
+    if after is not None:
+        start = max(start, bisect_right(catalog.sorted_paths, tuple(after.split("/", 2))))
+    positions = heapq.nsmallest(
+        limit + 1,
+        (
+            position
+            for position in map(catalog.path_positions.get, touched)
+            if position is not None and start <= position < end
+        ),
+    )
+    page = [catalog.sorted_paths[position] for position in positions[:limit]]
+    next_cursor = "/".join(page[-1]) if len(positions) > limit else None
+    return run_version, full, page, next_cursor
+
+
+def negotiate_encoding(accept_encodings) -> str | None:
+    if brotli is not None and "br" in accept_encodings:
+        return "br"
+    if "gzip" in accept_encodings:
+        return "gzip"
+    return None
+
+
+def encode_body(body: bytes, encoding: str | None) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=5)
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=6)
+    return body
+
+
+def results_response(payload: dict, etag: str) -> Response:
+    """Compact JSON, compressed as the client prefers; the encoding is part of the ETag."""
+    encoding = negotiate_encoding(request.accept_encodings)
+    body = encode_body(json.dumps(payload, separators=(",", ":")).encode("utf-8"), encoding)
+    response = Response(body, mimetype="application/json")
+    if encoding:
+        response.content_encoding = encoding
+    response.vary.add("Accept-Encoding")
+    response.set_etag(f"{etag}-{encoding}" if encoding else etag)
+    return response
+
+
+def build_teacher_topic_results(
+    run_id: str,
+    subject_id: str,
+    topic_id: str,
+    only_poll_ids: set[str] | None = None,
+) -> list[dict]:
+    catalog = get_poll_catalog()
+    poll_keys = [
+        (subject_id, topic_id, poll_id)
+        for poll_id in catalog.topic_poll_ids.get((subject_id, topic_id), ())
+        if only_poll_ids is None or poll_id in only_poll_ids
+    ]
+    return build_results(run_id, catalog, poll_keys)
+
+
+def iter_run_exports(run_ids: list[str]) -> Iterator[tuple[str, dict]]:
+    # Runs are fetched a batch at a time, so only one batch is ever held in memory.
+    for start in range(0, len(run_ids), EXPORT_BATCH_RUNS):
+        yield from RESULT_STORE.export_runs(run_ids[start : start + EXPORT_BATCH_RUNS])
+
+
+def iter_export_rows(runs: Iterable[tuple[str, dict]]) -> Iterator[dict]:
+    """Yield one row per run, poll and answer: each option of a choice poll, each distinct text answer."""
+    catalog = get_poll_catalog()
+    for run_id, state in runs:
+        run_created = datetime.fromtimestamp(state["created"], timezone.utc).isoformat(timespec="seconds")
+        for reference, entry in sorted(state["results"].items()):
+            subject_id, topic_id, poll_id = parse_poll_reference(reference)
+            poll = catalog.polls_by_path.get((subject_id, topic_id, poll_id), {})
+            answers = entry["text_counts"] if entry["answer_type"] == "text" else entry["counts"]
+            # Single-choice entries do not keep a response count; it is the sum of their counts.
+            total = sum(answers.values()) if entry["answer_type"] == "single_choice" else entry["response_count"]
+            row = {
+                "run": run_id,
+                "run_created": run_created,
                 "subject": subject_id,
                 "topic": topic_id,
-                "poll_id": poll_id,
-                "question": poll.get("question", poll_id),
-                "answer_type": answer_type,
-                "path": f"/{subject_id}/{topic_id}/{poll_id}",
-                "language": poll.get("language", "en"),
+                "poll": poll_id,
+                "question": poll.get("question", ""),
+                "answer_type": entry["answer_type"],
+                "total_responses": total,
             }
+            for answer, count in answers.items():
+                yield {**row, "answer": answer, "count": count}
+
+
+def export_chunks(runs: Iterable[tuple[str, dict]], export_format: str, compress: bool) -> Iterator[bytes]:
+    _, _, encode = EXPORT_FORMATS[export_format]
+    chunks = encode_chunks(encode(iter_export_rows(runs)))
+    return gzip_chunks(chunks) if compress else chunks
+
+
+def build_rollup_result(
+    subject_id: str, topic_id: str, poll_id: str, poll: Mapping, since: float | None, until: float | None, per_bucket: bool
+) -> dict:
+    rollups = RESULT_STORE.rollups(poll, since, until, per_bucket)
+    result = build_poll_result(subject_id, topic_id, poll_id, poll, rollups["total"])
+    result["runs"] = rollups["total"]["runs"]
+    if per_bucket:
+        result["buckets"] = [
+            {
+                "start": datetime.fromtimestamp(bucket, timezone.utc).isoformat(timespec="seconds"),
+                "runs": entry["runs"],
+                **{
+                    key: value
+                    for key, value in build_poll_result(subject_id, topic_id, poll_id, poll, entry).items()
+                    if key in {"total_responses", "options", "terms"}
+                },
+            }
+            for bucket, entry in rollups["buckets"]
+        ]
+    return result
+
+
+def not_modified(etag: str, encoding: str | None = None) -> Response | None:
+    if encoding:
+        etag = f"{etag}-{encoding}"
+    if etag in request.if_none_match:
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+    return None
+
+
+def format_sse(event: str, data: dict) -> str:
+    frame = f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+    SSE_FRAME_SIZE.observe(len(frame), event)
+    return frame
 
-            if answer_type in {"single_choice", "multiple_choice"}:
-                counts = entry["counts"]
-                total = sum(counts.values()) if answer_type == "single_choice" else entry.get("response_count", 0)
-                options = []
-                for answer in poll.get("answers", []):
-                    count = counts.get(answer, 0)
-                    percentage = round((count / total) * 100, 1) if total else 0.0
-                    options.append(
-                        {
-                            "label": answer,
-                            "count": count,
-                            "percentage": percentage,
-                        }
-                    )
-                payload.append(
-                    {
-                        **base_data,
-                        "total_responses": total,
-                        "options": options,
-                    }
-                )
-            elif answer_type == "text":
-                text_counts = dict(entry["text_counts"])
-                terms = [
-                    {"term": term, "count": count}
-                    for term, count in compute_term_frequencies(text_counts)
-                ]
-                payload.append(
-                    {
-                        **base_data,
-                        "total_responses": sum(text_counts.values()),
-                        "terms": terms,
-                    }
-                )
+
+def get_topic_result_versions(run_id: str, subject_id: str, topic_id: str) -> dict[str, int]:
+    poll_ids = get_topic_poll_ids(subject_id, topic_id)
+    paths = [(subject_id, topic_id, poll_id) for poll_id in poll_ids]
+    return dict(zip(poll_ids, RESULT_STORE.versions(run_id, paths)))
+
+
+class TopicStream:
+    """What one event-stream client of a topic has been sent, and what it still needs.
+
+    The first frames carry the current state; afterwards an ``active`` frame is
+    sent whenever the selection changes and, for teachers, a ``results`` frame
+    with only the polls whose versions changed. ``run`` is the loop; the WSGI
+    generator below and the asyncio server in asgi.py pass it their way of waiting.
+    """
+
+    def __init__(self, run_id: str, subject_id: str, topic_id: str, include_results: bool) -> None:
+        self.run_id = run_id
+        self.subject_id = subject_id
+        self.topic_id = topic_id
+        self.include_results = include_results
+        self.topic_key = build_topic_key(run_id, subject_id, topic_id)
+        # Changes made by other worker processes never reach this process's hub,
+        # so a shared store is also checked on a short interval.
+        self.check_interval = SHARED_STATE_POLL_SECONDS if RESULT_STORE.shared else SSE_HEARTBEAT_SECONDS
+        self.sent_poll_id: str | None = None
+        self.sent_version = 0
+        self.sent_versions: dict[str, int] = {}
+        self.last_sent = monotonic()
+
+    def opening_frames(self) -> list[str]:
+        self.sent_poll_id, self.sent_version = get_active_topic_state(self.run_id, self.subject_id, self.topic_id)
+        frames = [
+            # Jittered, so streams dropped together do not all reconnect together.
+            f"retry: {SSE_RETRY_MILLISECONDS + random.randrange(SSE_RETRY_MILLISECONDS)}\n\n",
+            format_sse("active", {"active_poll_id": self.sent_poll_id, "version": self.sent_version}),
+        ]
+        if self.include_results:
+            self.sent_versions = get_topic_result_versions(self.run_id, self.subject_id, self.topic_id)
+            polls = build_teacher_topic_results(self.run_id, self.subject_id, self.topic_id)
+            frames.append(format_sse("results", {"polls": polls, "full": True}))
+        self.last_sent = monotonic()
+        return frames
+
+    def active_frames(self) -> list[str]:
+        active_poll_id, version = get_active_topic_state(self.run_id, self.subject_id, self.topic_id)
+        if (active_poll_id, version) == (self.sent_poll_id, self.sent_version):
+            return []
+        self.sent_poll_id, self.sent_version = active_poll_id, version
+        self.last_sent = monotonic()
+        return [format_sse("active", {"active_poll_id": active_poll_id, "version": version})]
+
+    def results_pending(self) -> bool:
+        if not self.include_results:
+            return False
+        return get_topic_result_versions(self.run_id, self.subject_id, self.topic_id) != self.sent_versions
+
+    def results_frames(self) -> list[str]:
+        versions = get_topic_result_versions(self.run_id, self.subject_id, self.topic_id)
+        changed = {poll_id for poll_id, version in versions.items() if self.sent_versions.get(poll_id) != version}
+        if not changed:
+            return []
+        self.sent_versions = versions
+        polls = build_teacher_topic_results(self.run_id, self.subject_id, self.topic_id, changed)
+        self.last_sent = monotonic()
+        return [format_sse("results", {"polls": polls, "full": False})]
+
+    def keepalive_frames(self) -> list[str]:
+        if monotonic() - self.last_sent < SSE_HEARTBEAT_SECONDS:
+            return []
+        self.last_sent = monotonic()
+        return [": keepalive\n\n"]
+
+    async def run(
+        self,
+        wait: Callable[[float], Awaitable[bool]],
+        pause: Callable[[float], Awaitable[None]],
+        call: Callable[[Callable[[], list[str] | bool]], Awaitable[list[str] | bool]],
+    ) -> AsyncIterator[str]:
+        """Yield each non-empty batch of frames to send, until the consumer stops.
+
+        ``wait(timeout)`` returns whether the hub announced a change before the
+        timeout, ``pause(seconds)`` sleeps, and ``call(method)`` runs one of the
+        methods above that read the store. Bursts of submissions are folded into
+        one frame per SSE_COALESCE_SECONDS.
+        """
+        opening = await call(self.opening_frames)
+        if opening:
+            yield "".join(opening)
+        while True:
+            notified = await wait(self.check_interval)
+            active = await call(self.active_frames)
+            if active:
+                yield "".join(active)
+            if await call(self.results_pending):
+                if notified:
+                    # Let the rest of a submission burst land before rendering.
+                    await pause(SSE_COALESCE_SECONDS)
+                results = await call(self.results_frames)
+                if results:
+                    yield "".join(results)
+            keepalive = self.keepalive_frames()
+            if keepalive:
+                yield "".join(keepalive)
+
+
+def iterate_blocking(batches: AsyncIterator[str]) -> Iterator[str]:
+    """Drive an async generator whose awaits never suspend as a plain generator."""
+    try:
+        while True:
+            try:
+                batches.__anext__().send(None)
+            except StopIteration as done:
+                yield done.value
+            except StopAsyncIteration:
+                return
             else:
-                payload.append({**base_data, "total_responses": 0})
+                raise RuntimeError("a blocking stream awaited something that suspends")
+    finally:
+        try:
+            batches.aclose().send(None)
+        except StopIteration:
+            pass
 
-    return payload
 
+def stream_topic_events(run_id: str, subject_id: str, topic_id: str, include_results: bool):
+    """Yield SSE frames for one topic until the client disconnects."""
+    stream = TopicStream(run_id, subject_id, topic_id, include_results)
+    wakeup = Event()
 
-def build_teacher_topic_results(run_id: str, subject_id: str, topic_id: str) -> list[dict]:
-    polls_by_path = load_polls()
-    payload = []
+    async def wait(timeout: float) -> bool:
+        notified = wakeup.wait(timeout)
+        wakeup.clear()
+        return notified
 
-    with RESULTS_LOCK:
-        for (current_subject, current_topic, poll_id), poll in polls_by_path.items():
-            if current_subject != subject_id or current_topic != topic_id:
-                continue
+    async def pause(seconds: float) -> None:
+        sleep(seconds)
 
-            submission_key = build_submission_key(run_id, subject_id, topic_id, poll_id)
-            entry = ensure_result_entry(submission_key, poll)
-            answer_type = poll.get("answer_type")
+    async def call(method):
+        return method()
 
-            base_data = {
-                "subject": subject_id,
-                "topic": topic_id,
-                "poll_id": poll_id,
-                "question": poll.get("question", poll_id),
-                "answer_type": answer_type,
-                "path": f"/{subject_id}/{topic_id}/{poll_id}",
-                "language": poll.get("language", "en"),
-            }
+    EVENT_HUB.subscribe(stream.topic_key, wakeup.set)
+    try:
+        yield from iterate_blocking(stream.run(wait, pause, call))
+    finally:
+        EVENT_HUB.unsubscribe(stream.topic_key, wakeup.set)
 
-            if answer_type in {"single_choice", "multiple_choice"}:
-                counts = entry["counts"]
-                total = sum(counts.values()) if answer_type == "single_choice" else entry.get("response_count", 0)
-                options = []
-                for answer in poll.get("answers", []):
-                    count = counts.get(answer, 0)
-                    percentage = round((count / total) * 100, 1) if total else 0.0
-                    options.append(
-                        {
-                            "label": answer,
-                            "count": count,
-                            "percentage": percentage,
-                        }
-                    )
-                payload.append(
-                    {
-                        **base_data,
-                        "total_responses": total,
-                        "options": options,
-                    }
-                )
-            elif answer_type == "text":
-                text_counts = dict(entry["text_counts"])
-                terms = [
-                    {"term": term, "count": count}
-                    for term, count in compute_term_frequencies(text_counts)
-                ]
-                payload.append(
-                    {
-                        **base_data,
-                        "total_responses": sum(text_counts.values()),
-                        "terms": terms,
-                    }
-                )
-            else:
-                payload.append({**base_data, "total_responses": 0})
 
-    return payload
+def event_stream_response(stream) -> Response:
+    return Response(
+        stream,
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+ADMISSION = (
+    AdmissionController(
+        rate=ADMISSION_RATE,
+        burst=ADMISSION_BURST,
+        max_in_flight=ADMISSION_MAX_IN_FLIGHT,
+        teacher_reserve=ADMISSION_TEACHER_RESERVE,
+        clients_per_address=ADMISSION_CLIENTS_PER_ADDRESS,
+    )
+    if ADMISSION_CONTROL
+    else None
+)
+
+
+def render_busy_page(subject_id: str, retry_after: int, resubmit: Iterable[tuple[str, str]] | None = None) -> str:
+    """The page a shed topic request gets: it retries by itself after a jittered delay."""
+    language = get_poll_catalog().subject_languages.get(subject_id, "en")
+    return render_template(
+        "busy.html",
+        language=language,
+        retry_after=retry_after,
+        resubmit=list(resubmit) if resubmit is not None else None,
+        ui=ui_texts(language),
+    )
+
+
+SERVING = False
+SERVING_LOCK = Lock()
+
+
+def start_serving(handle_signals: bool = True) -> None:
+    """Restore the results store and start the background threads of a serving process.
+
+    Importing the app starts nothing, so a process that never serves (the
+    reloader's parent, a CLI command) does not open the results database.
+    With ``handle_signals`` SIGTERM becomes a normal exit, so ``docker stop``
+    applies queued submissions and closes the store instead of dropping them.
+    """
+    global SERVING
+    with SERVING_LOCK:
+        if SERVING:
+            return
+        RESULT_STORE.start(load_polls())
+        if POLL_RELOAD_SECONDS:
+            Thread(target=watch_poll_catalog, name="poll-catalog-reloader", daemon=True).start()
+        atexit.register(stop_serving)
+        SERVING = True
+    if handle_signals and current_thread() is main_thread():
+        signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+
+
+def stop_serving() -> None:
+    """Apply every queued submission, then compact and close the results store."""
+    global SERVING
+    with SERVING_LOCK:
+        if not SERVING:
+            return
+        SERVING = False
+    if SUBMISSION_INGESTOR is not None:
+        SUBMISSION_INGESTOR.flush()
+    RESULT_STORE.close()
+
+
+def read_stored_results() -> None:
+    """Load persisted results for a command that only reads them."""
+    if not RESULT_STORE.shared:
+        RESULT_STORE.restore(load_polls())
+
+
+METRICS.gauge("tellme_runs", "Runs held in memory by the results store.", RESULT_STORE.run_count)
+METRICS.gauge(
+    "tellme_ingest_queue_depth",
+    "Submissions waiting for the ingestion thread.",
+    lambda: SUBMISSION_INGESTOR.stats()["queue_depth"] if SUBMISSION_INGESTOR is not None else 0,
+)
+
+
+@app.before_request
+def ensure_serving() -> None:
+    # Servers other than app.py, serve-state and asgi.py start the store on the first request.
+    if not SERVING:
+        start_serving(handle_signals=False)
+
+
+@app.before_request
+def start_request_timer() -> None:
+    g.request_started = perf_counter()
+
+
+@app.before_request
+def admit_request() -> Response | None:
+    teacher = ADMISSION_ENDPOINTS.get(request.endpoint)
+    if ADMISSION is None or teacher is None:
+        return None
+    student = None if teacher else session.get("student")
+    shed = ADMISSION.admit(teacher, student, request.remote_addr or "")
+    if shed is None:
+        g.admitted = True
+        return None
+    status, retry_after = shed
+    ADMISSION_SHED.inc(request.url_rule.rule, status)
+    if request.endpoint == "topic_entry":
+        resubmit = request.form.items(multi=True) if request.method == "POST" else None
+        response = Response(render_busy_page(request.view_args["subject_id"], retry_after, resubmit), status=status)
+    else:
+        response = jsonify({"error": "busy", "retry_after": retry_after})
+        response.status_code = status
+    response.headers["Retry-After"] = str(retry_after)
+    return response
+
+
+@app.teardown_request
+def release_admission(exc: BaseException | None) -> None:
+    if g.pop("admitted", False):
+        ADMISSION.release()
+
+
+@app.after_request
+def record_request_metrics(response: Response) -> Response:
+    route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+    REQUEST_COUNT.inc(route, request.method, response.status_code)
+    REQUEST_LATENCY.observe(perf_counter() - g.request_started, route)
+    if not response.is_streamed:
+        RESPONSE_SIZE.observe(len(response.get_data()), route)
+    return response
+
+
+@app.cli.command("serve-state")
+@click.option("--address", default=DEFAULT_SHARED_STATE_ADDRESS, show_default=True, help="Unix socket to listen on.")
+def serve_state_command(address: str) -> None:
+    """Serve this process's results store to worker processes.
+
+    Start it with SHARED_STATE_ADDRESS unset (this process owns the store and
+    its persistence), then start the workers with SHARED_STATE_ADDRESS set to
+    the same socket path. gunicorn.conf.py does both.
+    """
+    if RESULT_STORE.shared:
+        raise click.UsageError("unset SHARED_STATE_ADDRESS for the state server itself")
+    if not SHARED_STATE_AUTHKEY:
+        raise click.UsageError("set SHARED_STATE_AUTHKEY to a secret shared with the workers")
+    Path(address).unlink(missing_ok=True)
+    manager = BaseManager(address=address, authkey=SHARED_STATE_AUTHKEY)
+    manager.register("results", callable=lambda: RESULT_STORE)
+    start_serving()
+    click.echo(f"Serving shared results state on {address}")
+    manager.get_server().serve_forever()
+
+
+@app.cli.command("export")
+@click.option(
+    "--run",
+    "run_ids",
+    type=click.UUID,
+    multiple=True,
+    help="Run id to export; repeat for several. Default: every run in range.",
+)
+@click.option("--since", type=click.DateTime(), help="Only runs created at or after this UTC time.")
+@click.option("--until", type=click.DateTime(), help="Only runs created before this UTC time.")
+@click.option("--format", "export_format", type=click.Choice(sorted(EXPORT_FORMATS)), default="csv", show_default=True)
+@click.option("--gzip", "compress", is_flag=True, help="Compress the output with gzip.")
+@click.option("--output", "-o", default="-", show_default=True, help="File to write, or - for stdout.")
+def export_command(
+    run_ids: tuple[UUID, ...],
+    since: datetime | None,
+    until: datetime | None,
+    export_format: str,
+    compress: bool,
+    output: str,
+) -> None:
+    """Stream results of runs as CSV or NDJSON, one row per poll answer.
+
+    Reads the store of the server it shares SHARED_STATE_ADDRESS with or, when
+    that is unset, the persisted results in RESULTS_STORAGE.
+    """
+    read_stored_results()
+    since_timestamp = since.replace(tzinfo=timezone.utc).timestamp() if since else None
+    until_timestamp = until.replace(tzinfo=timezone.utc).timestamp() if until else None
+    selected = RESULT_STORE.run_ids(since_timestamp, until_timestamp)
+    if run_ids:
+        wanted = {str(run_id) for run_id in run_ids}
+        selected = [run_id for run_id in selected if run_id in wanted]
+    with click.open_file(output, "wb") as stream:
+        for chunk in export_chunks(iter_run_exports(selected), export_format, compress):
+            stream.write(chunk)
+    click.echo(f"Exported {len(selected)} runs", err=True)
+
+
+@app.cli.command("analytics")
+@click.argument("subject_id")
+@click.argument("topic_id")
+@click.argument("poll_id", required=False)
+@click.option("--since", type=click.DateTime(), help="Only runs whose bucket starts at or after this UTC time.")
+@click.option("--until", type=click.DateTime(), help="Only runs whose bucket starts before this UTC time.")
+@click.option("--buckets", "per_bucket", is_flag=True, help="Also list the results of each bucket.")
+def analytics_command(
+    subject_id: str,
+    topic_id: str,
+    poll_id: str | None,
+    since: datetime | None,
+    until: datetime | None,
+    per_bucket: bool,
+) -> None:
+    """Print the results of a topic's polls, or of one poll, summed over every run as JSON.
+
+    These are the answers of every class, so they are not served over HTTP.
+    Reads the same store as ``export``.
+    """
+    read_stored_results()
+    catalog = get_poll_catalog()
+    poll_ids = (poll_id,) if poll_id else catalog.topic_poll_ids.get((subject_id, topic_id), ())
+    paths = [(subject_id, topic_id, poll_id) for poll_id in poll_ids]
+    if not paths or any(path not in catalog.polls_by_path for path in paths):
+        raise click.UsageError(f"no such poll or topic: {'/'.join(filter(None, (subject_id, topic_id, poll_id)))}")
+    since_timestamp = since.replace(tzinfo=timezone.utc).timestamp() if since else None
+    until_timestamp = until.replace(tzinfo=timezone.utc).timestamp() if until else None
+    polls = [
+        build_rollup_result(*path, catalog.polls_by_path[path], since_timestamp, until_timestamp, per_bucket)
+        for path in paths
+    ]
+    result = polls[0] if poll_id else {"polls": polls}
+    click.echo(json.dumps({**result, "bucket_seconds": ROLLUP_BUCKET_SECONDS}, ensure_ascii=False, indent=2))
 
 
 @app.get("/")
@@ -479,13 +1424,7 @@ def teacher_topic_dashboard(subject_id: str, topic_id: str):
     run_id = get_run_id_or_404()
     if not build_teacher_topic_results(run_id, subject_id, topic_id):
         abort(404)
-    language = "en"
-    polls_by_path = load_polls()
-    for (current_subject, _, _), poll in polls_by_path.items():
-        if current_subject == subject_id:
-            language = normalize_language(poll.get("language"))
-            break
-    ensure_active_topic_poll(run_id, subject_id, topic_id)
+    language = get_poll_catalog().subject_languages.get(subject_id, "en")
     return render_template(
         "teacher_topic.html",
         subject_id=subject_id,
@@ -498,18 +1437,160 @@ def teacher_topic_dashboard(subject_id: str, topic_id: str):
 @app.get("/api/teacher/results")
 def teacher_results_api():
     run_id = get_run_id_or_404()
-    return jsonify({"polls": build_teacher_results(run_id)})
+    catalog = get_poll_catalog()
+    subject_id = request.args.get("subject") or None
+    topic_id = request.args.get("topic") or None
+    if topic_id is not None and subject_id is None:
+        return jsonify({"error": "topic needs a subject"}), 400
+    start, end = catalog.scope_range(subject_id, topic_id)
+    if start == end:
+        abort(404)
+    limit = min(max(request.args.get("limit", RESULTS_PAGE_SIZE, type=int), 1), RESULTS_MAX_PAGE_SIZE)
+    after = request.args.get("cursor") or None
+    since = request.args.get("since")
+    run_version, full, page, next_cursor = select_results_page(
+        run_id, catalog, start, end, after, limit, parse_results_cursor(since, catalog)
+    )
+    # The run version covers every poll the page could contain, so it stands in for their versions.
+    etag = fingerprint_etag(catalog.digest, run_version, subject_id, topic_id, after, limit, since)
+    cached_response = not_modified(etag, negotiate_encoding(request.accept_encodings))
+    if cached_response is not None:
+        return cached_response
+
+    polls = build_results(run_id, catalog, page)
+    payload = {
+        "version": f"{run_version}.{catalog.digest[:8]}",
+        "full": full,
+        "polls": polls if full else [compact_poll_result(result) for result in polls],
+        "next_cursor": next_cursor,
+    }
+    return results_response(payload, etag)
 
 
 @app.get("/api/teacher/<subject_id>/<topic_id>/results")
 @app.get("/api/techer/<subject_id>/<topic_id>/results")
 def teacher_topic_results_api(subject_id: str, topic_id: str):
     run_id = get_run_id_or_404()
-    polls = build_teacher_topic_results(run_id, subject_id, topic_id)
-    if not polls:
+    results = read_topic_results(run_id, get_poll_catalog(), subject_id, topic_id, request.args.get("since"))
+    if results is None:
+        abort(404)
+    cached_response = not_modified(results.etag, negotiate_encoding(request.accept_encodings))
+    if cached_response is not None:
+        return cached_response
+    return results_response(results.payload(), results.etag)
+
+
+@app.get("/metrics")
+def metrics_api():
+    return Response(METRICS.render(), mimetype="text/plain; version=0.0.4")
+
+
+@app.get("/api/status/profile")
+def profile_status_api():
+    if not PROFILING:
         abort(404)
-    active_poll_id = ensure_active_topic_poll(run_id, subject_id, topic_id)
-    return jsonify({"polls": polls, "active_poll_id": active_poll_id})
+    if request.args.get("format") == "folded":
+        folded = "".join(f"{stack} {count}\n" for stack, count in PROFILER.folded())
+        return Response(folded, mimetype="text/plain")
+    top = [{"stack": stack, "samples": count} for stack, count in PROFILER.folded(limit=50)]
+    return jsonify({**PROFILER.status(), "top": top})
+
+
+@app.post("/api/status/profile")
+def profile_toggle_api():
+    if not PROFILING:
+        abort(404)
+    payload = request.get_json(silent=True) or {}
+    if payload.get("enabled"):
+        interval = payload.get("interval", 0.01)
+        if not isinstance(interval, (int, float)) or not 0.001 <= interval <= 1:
+            return jsonify({"error": "interval must be between 0.001 and 1 seconds"}), 400
+        PROFILER.start(float(interval))
+    else:
+        PROFILER.stop()
+    return jsonify(PROFILER.status())
+
+
+@app.get("/api/status/ingest")
+def ingest_status_api():
+    if SUBMISSION_INGESTOR is None:
+        return jsonify({"mode": "inline"})
+    return jsonify({"mode": "batched", **SUBMISSION_INGESTOR.stats()})
+
+
+@app.get("/api/status/runs")
+def runs_status_api():
+    # Run ids double as access keys, so the overview only shows a short hash of each.
+    runs = sorted(RESULT_STORE.run_stats(), key=lambda stats: stats["bytes"], reverse=True)
+    for stats in runs:
+        stats["run"] = hashlib.blake2b(stats["run"].encode("utf-8"), digest_size=4).hexdigest()
+    return jsonify(
+        {
+            "runs": runs,
+            "total_runs": len(runs),
+            "total_bytes": sum(stats["bytes"] for stats in runs),
+            "idle_seconds": RUN_IDLE_SECONDS,
+        }
+    )
+
+
+@app.get("/api/teacher/export")
+def teacher_export_api():
+    run_id = get_run_id_or_404()
+    export_format = request.args.get("format", "csv")
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({"error": f"format must be one of: {', '.join(sorted(EXPORT_FORMATS))}"}), 400
+    runs = RESULT_STORE.export_runs([run_id])
+    if not runs:
+        abort(404)
+    content_type, extension, _ = EXPORT_FORMATS[export_format]
+    compress = "gzip" in request.accept_encodings
+    response = Response(export_chunks(runs, export_format, compress), content_type=content_type)
+    response.headers["Content-Disposition"] = f'attachment; filename="tellme-{run_id}.{extension}"'
+    response.vary.add("Accept-Encoding")
+    if compress:
+        response.content_encoding = "gzip"
+    return response
+
+
+@app.get("/api/teacher/run")
+def teacher_run_api():
+    run_id = get_run_id_or_404()
+    stats = RESULT_STORE.run_stats(run_id)
+    if not stats:
+        abort(404)
+    return jsonify(stats[0])
+
+
+@app.get("/api/student/<subject_id>/<topic_id>/active")
+def student_topic_active_api(subject_id: str, topic_id: str):
+    # Student pages only need to know which poll to show, so this avoids building
+    # (and exposing) the live results that the teacher API returns.
+    run_id = get_run_id_or_404()
+    active_poll_id, version = get_active_topic_state(run_id, subject_id, topic_id)
+    if not active_poll_id:
+        abort(404)
+    response = jsonify({"active_poll_id": active_poll_id, "version": version})
+    response.set_etag(f"{version}-{active_poll_id}")
+    response.headers["Cache-Control"] = "no-cache"
+    return response.make_conditional(request)
+
+
+@app.get("/api/student/<subject_id>/<topic_id>/events")
+def student_topic_events_api(subject_id: str, topic_id: str):
+    run_id = get_run_id_or_404()
+    if not app.config["EVENT_STREAMS"] or not get_active_topic_poll(run_id, subject_id, topic_id):
+        abort(404)
+    return event_stream_response(stream_topic_events(run_id, subject_id, topic_id, include_results=False))
+
+
+@app.get("/api/teacher/<subject_id>/<topic_id>/events")
+@app.get("/api/techer/<subject_id>/<topic_id>/events")
+def teacher_topic_events_api(subject_id: str, topic_id: str):
+    run_id = get_run_id_or_404()
+    if not app.config["EVENT_STREAMS"] or not get_active_topic_poll(run_id, subject_id, topic_id):
+        abort(404)
+    return event_stream_response(stream_topic_events(run_id, subject_id, topic_id, include_results=True))
 
 
 @app.post("/api/teacher/<subject_id>/<topic_id>/active")
@@ -530,7 +1611,9 @@ def teacher_topic_active_api(subject_id: str, topic_id: str):
     return jsonify({"ok": True, "active_poll_id": poll_id})
 
 
-def render_student_poll(run_id: str, subject_id: str, topic_id: str, poll_id: str):
+def render_student_poll(
+    run_id: str, subject_id: str, topic_id: str, poll_id: str, stored_answer: str | list[str] | None
+):
     polls_by_path = load_polls()
     poll = polls_by_path.get((subject_id, topic_id, poll_id))
     if not poll:
@@ -538,11 +1621,14 @@ def render_student_poll(run_id: str, subject_id: str, topic_id: str, poll_id: st
 
     submission_key = build_submission_key(run_id, subject_id, topic_id, poll_id)
     submitted_answers = dict(session.get("submitted_answers", {}))
-    previous_answer = submitted_answers.get(submission_key)
+    if "student" not in session:
+        # Set on the first view, so admission control tells students behind one address apart.
+        session["student"] = secrets.token_urlsafe(9)
+    student = session["student"] if STUDENT_LEDGER == "server" else None
+    previous_answer = load_student_answer(run_id, poll, stored_answer, submitted_answers)
     submitted_answer = previous_answer
     error = None
     language = normalize_language(poll.get("language"))
-    already_submitted = previous_answer is not None
 
     if request.method == "POST":
         answer_type = poll.get("answer_type")
@@ -567,16 +1653,45 @@ def render_student_poll(run_id: str, subject_id: str, topic_id: str, poll_id: st
             error = msg("missing_answer", locale=language)
 
         if submitted_answer and not error:
-            record_submission(
-                submission_key=submission_key,
+            if STUDENT_LEDGER == "server":
+                # The store replaces the answer in the ledger when it applies the
+                # submission; only an answer the ledger never saw goes along with it.
+                previous_answer = submitted_answers.pop(submission_key, None)
+                if previous_answer is not None:
+                    if submitted_answers:
+                        session["submitted_answers"] = submitted_answers
+                    else:
+                        session.pop("submitted_answers")
+            else:
+                submitted_answers[submission_key] = submitted_answer
+                session["submitted_answers"] = submitted_answers
+            ingest_submission(
+                run_id=run_id,
+                subject_id=subject_id,
+                topic_id=topic_id,
                 poll=poll,
                 submitted_answer=submitted_answer,
                 previous_answer=previous_answer,
+                student=student,
             )
-            submitted_answers[submission_key] = submitted_answer
-            session["submitted_answers"] = submitted_answers
-            already_submitted = True
 
+    return fill_student_page(run_id, poll, language, submitted_answer, error)
+
+
+def load_student_answer(
+    run_id: str, poll: Mapping, stored_answer: str | list[str] | None, submitted_answers: Mapping
+) -> str | list[str] | None:
+    """The student's answer: ``stored_answer`` from the ledger, else the one in the cookie."""
+    if stored_answer is None:
+        # Answers given before the server-side ledger existed still live in the cookie.
+        subject_id, topic_id, poll_id = poll_path(poll)
+        return submitted_answers.get(build_submission_key(run_id, subject_id, topic_id, poll_id))
+    return stored_answer
+
+
+def fill_student_page(
+    run_id: str, poll: Mapping, language: str, submitted_answer: str | list[str] | None, error: str | None
+) -> str:
     if isinstance(submitted_answer, list):
         selected_answers = submitted_answer
         submitted_answer_display = ", ".join(submitted_answer)
@@ -590,30 +1705,53 @@ def render_student_poll(run_id: str, subject_id: str, topic_id: str, poll_id: st
         submitted_answer_display = None
         text_value = ""
 
-    return render_template(
-        "poll.html",
-        poll=poll,
-        submitted_answer=submitted_answer,
-        submitted_answer_display=submitted_answer_display,
-        selected_answers=selected_answers,
-        text_value=text_value,
-        error=error,
-        already_submitted=already_submitted,
-        ui=ui_texts(language),
-        subject_id=subject_id,
-        topic_id=topic_id,
-        poll_id=poll_id,
-        run_id=run_id,
+    page = get_poll_page(*poll_path(poll), poll, language)
+    status = ""
+    if error or submitted_answer_display:
+        status = render_template(
+            "poll_status.html",
+            error=error,
+            submitted_answer_display=submitted_answer_display,
+            ui=ui_texts(language),
+        )
+    positions = option_positions(tuple(poll.get("answers", ())))
+    return page.fill(
+        {"status": status, "text_value": escape(text_value), "run_id": htmlsafe_json_dumps(run_id)},
+        {positions[answer] for answer in selected_answers if answer in positions},
     )
 
 
+def get_poll_page(subject_id: str, topic_id: str, poll_id: str, poll: Mapping, language: str) -> CompiledPage:
+    """Return the student page of a poll, compiled once per catalog version."""
+    global POLL_PAGES
+    digest = get_poll_catalog().digest
+    cached_digest, pages = POLL_PAGES
+    if cached_digest != digest:
+        # A reloaded catalog may have changed any question or option.
+        pages = {}
+        POLL_PAGES = (digest, pages)
+    key = (subject_id, topic_id, poll_id, language)
+    page = pages.get(key)
+    if page is None:
+        page = pages[key] = compile_page(
+            "poll.html",
+            poll=poll,
+            ui=ui_texts(language),
+            subject_id=subject_id,
+            topic_id=topic_id,
+            poll_id=poll_id,
+        )
+    return page
+
+
 @app.route("/<subject_id>/<topic_id>", methods=["GET", "POST"])
 def topic_entry(subject_id: str, topic_id: str):
     run_id = get_run_id_or_404()
-    active_poll_id = ensure_active_topic_poll(run_id, subject_id, topic_id)
+    student = session.get("student") if STUDENT_LEDGER == "server" else None
+    active_poll_id, stored_answer = get_active_topic_answer(run_id, subject_id, topic_id, student)
     if not active_poll_id:
         abort(404)
-    return render_student_poll(run_id, subject_id, topic_id, active_poll_id)
+    return render_student_poll(run_id, subject_id, topic_id, active_poll_id, stored_answer)
 
 
 @app.route("/<subject_id>/<topic_id>/<poll_id>", methods=["GET", "POST"])
@@ -624,4 +1762,6 @@ def poll_page(subject_id: str, topic_id: str, poll_id: str):
 
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5001, debug=True)
+    start_serving()
+    # The reloader would import the app in a second process holding the same database.
+    app.run(host="0.0.0.0", port=5001, debug=True, use_reloader=False)
@@ -0,0 +1,417 @@
+"""Asyncio front end for the poll server.
+
+The hot endpoints are served here directly: the student topic page, the
+active-poll and topic results APIs, and the event streams. An open event stream
+is a coroutine waiting on an ``asyncio.Event`` instead of a blocked thread, so
+one process on one core can hold thousands of them. Every other request (form
+posts, teacher pages, status endpoints) and every error case is passed to the
+Flask app on a small thread pool, so URLs, ``?id=`` handling and error pages are
+the same as in ``python app.py``, which stays the fallback.
+
+This is a plain ASGI application with no extra dependencies; serve it with any
+ASGI server, for example uvicorn (``pip install uvicorn``)::
+
+    cd server
+    uvicorn asgi:app --port 5001
+"""
+
+import asyncio
+import json
+from collections.abc import Awaitable, Callable
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from io import BytesIO
+import os
+import re
+import sys
+from time import perf_counter
+from urllib.parse import parse_qs
+from uuid import UUID
+
+from itsdangerous import BadSignature
+from werkzeug.http import parse_accept_header, parse_cookie, parse_etags
+
+from app import (
+    ADMISSION,
+    ADMISSION_ENDPOINTS,
+    ADMISSION_SHED,
+    EVENT_HUB,
+    REQUEST_COUNT,
+    REQUEST_LATENCY,
+    RESPONSE_SIZE,
+    RESULT_STORE,
+    STUDENT_LEDGER,
+    TopicStream,
+    app as flask_app,
+    encode_body,
+    fill_student_page,
+    get_active_topic_answer,
+    get_active_topic_state,
+    get_poll_catalog,
+    load_student_answer,
+    negotiate_encoding,
+    normalize_language,
+    read_topic_results,
+    render_busy_page,
+    start_serving,
+    stop_serving,
+)
+
+# Threads for requests handed to Flask and, with a shared store, for store calls.
+ASGI_THREADS = max(1, int(os.getenv("ASGI_THREADS", "32")))
+EXECUTOR = ThreadPoolExecutor(max_workers=ASGI_THREADS, thread_name_prefix="asgi-wsgi")
+# Open streams cost a coroutine each here, so pages get pushed updates instead of polling.
+flask_app.config["EVENT_STREAMS"] = os.getenv("EVENT_STREAMS", "1") == "1"
+
+SEGMENT = "([^/]+)"
+ROUTES: list[tuple[re.Pattern, str, str]] = [
+    (re.compile(rf"/api/student/{SEGMENT}/{SEGMENT}/active"), "/api/student/<subject_id>/<topic_id>/active", "active"),
+    (re.compile(rf"/api/(?:teacher|techer)/{SEGMENT}/{SEGMENT}/results"), "/api/teacher/<subject_id>/<topic_id>/results", "results"),
+    (re.compile(rf"/api/student/{SEGMENT}/{SEGMENT}/events"), "/api/student/<subject_id>/<topic_id>/events", "student_events"),
+    (re.compile(rf"/api/(?:teacher|techer)/{SEGMENT}/{SEGMENT}/events"), "/api/teacher/<subject_id>/<topic_id>/events", "teacher_events"),
+    (re.compile(rf"/{SEGMENT}/{SEGMENT}"), "/<subject_id>/<topic_id>", "topic_entry"),
+]
+
+# (status, headers, body), or None to let the Flask app answer instead.
+NativeResponse = tuple[int, list[tuple[str, str]], bytes] | None
+
+
+async def off_loop(function: Callable, *args):
+    """Call into the results store without stalling the event loop.
+
+    The in-process store answers in microseconds and is called inline; a shared
+    store is a round trip to another process, so those calls go to a thread.
+    """
+    if RESULT_STORE.shared:
+        return await asyncio.get_running_loop().run_in_executor(EXECUTOR, partial(function, *args))
+    return function(*args)
+
+
+def read_headers(scope: dict) -> dict[str, str]:
+    headers: dict[str, str] = {}
+    for name, value in scope["headers"]:
+        name = name.decode("latin-1")
+        value = value.decode("latin-1")
+        headers[name] = f"{headers[name]},{value}" if name in headers else value
+    return headers
+
+
+def parse_run_id(query: dict[str, list[str]]) -> str | None:
+    raw_id = query.get("id", [""])[0]
+    try:
+        return str(UUID(raw_id))
+    except ValueError:
+        return None
+
+
+def json_response(payload: dict, etag: str | None = None, extra_headers: list[tuple[str, str]] = ()) -> NativeResponse:
+    headers = [("content-type", "application/json"), *extra_headers]
+    if etag is not None:
+        headers.append(("etag", f'"{etag}"'))
+    return 200, headers, (flask_app.json.dumps(payload, separators=(",", ":")) + "\n").encode("utf-8")
+
+
+def not_modified(headers: dict[str, str], etag: str, extra_headers: list[tuple[str, str]] = ()) -> NativeResponse:
+    if parse_etags(headers.get("if-none-match")).contains(etag):
+        return 304, [("etag", f'"{etag}"'), *extra_headers], b""
+    return None
+
+
+def load_session(headers: dict[str, str]) -> dict:
+    """Read Flask's signed session cookie; a missing or forged cookie is an empty session."""
+    cookie = parse_cookie(headers.get("cookie", "")).get(flask_app.config["SESSION_COOKIE_NAME"])
+    serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+    if not cookie or serializer is None:
+        return {}
+    try:
+        return serializer.loads(cookie, max_age=int(flask_app.permanent_session_lifetime.total_seconds()))
+    except BadSignature:
+        return {}
+
+
+def active_poll_response(
+    run_id: str, subject_id: str, topic_id: str, query: dict[str, list[str]], headers: dict[str, str]
+) -> NativeResponse:
+    active_poll_id, version = get_active_topic_state(run_id, subject_id, topic_id)
+    if not active_poll_id:
+        return None
+    etag = f"{version}-{active_poll_id}"
+    cache_headers = [("cache-control", "no-cache")]
+    cached = not_modified(headers, etag, cache_headers)
+    if cached is not None:
+        return cached
+    return json_response({"active_poll_id": active_poll_id, "version": version}, etag, cache_headers)
+
+
+def topic_results_response(
+    run_id: str, subject_id: str, topic_id: str, query: dict[str, list[str]], headers: dict[str, str]
+) -> NativeResponse:
+    results = read_topic_results(run_id, get_poll_catalog(), subject_id, topic_id, query.get("since", [None])[0])
+    if results is None:
+        return None
+    encoding = negotiate_encoding(parse_accept_header(headers.get("accept-encoding")))
+    etag = results.etag
+    if encoding:
+        etag = f"{etag}-{encoding}"
+    extra_headers = [("vary", "Accept-Encoding")]
+    cached = not_modified(headers, etag, extra_headers)
+    if cached is not None:
+        return cached
+    body = encode_body(json.dumps(results.payload(), separators=(",", ":")).encode("utf-8"), encoding)
+    if encoding:
+        extra_headers.append(("content-encoding", encoding))
+    return 200, [("content-type", "application/json"), ("etag", f'"{etag}"'), *extra_headers], body
+
+
+def topic_entry_response(
+    run_id: str, subject_id: str, topic_id: str, query: dict[str, list[str]], headers: dict[str, str]
+) -> NativeResponse:
+    # GET only: answering a poll writes the session cookie, which stays Flask's job.
+    session = load_session(headers)
+    student = session.get("student") if STUDENT_LEDGER == "server" else None
+    active_poll_id, stored_answer = get_active_topic_answer(run_id, subject_id, topic_id, student)
+    poll = get_poll_catalog().polls_by_path.get((subject_id, topic_id, active_poll_id))
+    if not poll:
+        return None
+    submitted_answer = load_student_answer(run_id, poll, stored_answer, session.get("submitted_answers", {}))
+    with flask_app.app_context():
+        page = fill_student_page(run_id, poll, normalize_language(poll.get("language")), submitted_answer, None)
+    return 200, [("content-type", "text/html; charset=utf-8"), ("vary", "Cookie")], page.encode("utf-8")
+
+
+NATIVE_HANDLERS: dict[str, Callable[[str, str, str, dict[str, list[str]], dict[str, str]], NativeResponse]] = {
+    "active": active_poll_response,
+    "results": topic_results_response,
+    "topic_entry": topic_entry_response,
+}
+# The Flask endpoint each native route stands in for, to share its admission rules.
+NATIVE_ENDPOINTS = {
+    "active": "student_topic_active_api",
+    "results": "teacher_topic_results_api",
+    "topic_entry": "topic_entry",
+    "student_events": "student_topic_events_api",
+    "teacher_events": "teacher_topic_events_api",
+}
+
+
+def admit(scope: dict, kind: str, subject_id: str, headers: dict[str, str]) -> NativeResponse | bool:
+    """Apply the app's admission control: a shed response, or whether a slot was taken."""
+    teacher = ADMISSION_ENDPOINTS.get(NATIVE_ENDPOINTS.get(kind))
+    if ADMISSION is None or teacher is None:
+        return False
+    student = None if teacher else load_session(headers).get("student")
+    shed = ADMISSION.admit(teacher, student, scope["client"][0] if scope.get("client") else "")
+    if shed is None:
+        return True
+    status, retry_after = shed
+    if kind == "topic_entry":
+        with flask_app.app_context():
+            body = render_busy_page(subject_id, retry_after).encode("utf-8")
+        content_type = "text/html; charset=utf-8"
+    else:
+        body = json.dumps({"error": "busy", "retry_after": retry_after}).encode("utf-8")
+        content_type = "application/json"
+    return status, [("content-type", content_type), ("retry-after", str(retry_after))], body
+
+
+async def send_response(send: Callable[[dict], Awaitable[None]], status: int, headers: list, body: bytes) -> None:
+    raw_headers = [(name.encode("latin-1"), value.encode("latin-1")) for name, value in headers]
+    raw_headers.append((b"content-length", str(len(body)).encode("latin-1")))
+    await send({"type": "http.response.start", "status": status, "headers": raw_headers})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def stream_events(
+    receive: Callable[[], Awaitable[dict]],
+    send: Callable[[dict], Awaitable[None]],
+    stream: TopicStream,
+) -> None:
+    """Serve one event stream until the client goes away (see ``stream_topic_events``)."""
+    loop = asyncio.get_running_loop()
+    wakeup = asyncio.Event()
+
+    def notify() -> None:
+        # The hub calls this from whichever thread recorded the change.
+        loop.call_soon_threadsafe(wakeup.set)
+
+    async def wait(timeout: float) -> bool:
+        try:
+            await asyncio.wait_for(wakeup.wait(), timeout)
+            notified = True
+        except TimeoutError:
+            notified = False
+        wakeup.clear()
+        return notified
+
+    async def serve() -> None:
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [
+                    (b"content-type", b"text/event-stream; charset=utf-8"),
+                    (b"cache-control", b"no-cache"),
+                    (b"x-accel-buffering", b"no"),
+                ],
+            }
+        )
+        async for frames in stream.run(wait, asyncio.sleep, off_loop):
+            await send({"type": "http.response.body", "body": frames.encode("utf-8"), "more_body": True})
+
+    async def wait_for_disconnect() -> None:
+        while (await receive())["type"] != "http.disconnect":
+            pass
+
+    EVENT_HUB.subscribe(stream.topic_key, notify)
+    tasks = [asyncio.ensure_future(serve()), asyncio.ensure_future(wait_for_disconnect())]
+    try:
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            task.result()
+    finally:
+        EVENT_HUB.unsubscribe(stream.topic_key, notify)
+        for task in tasks:
+            task.cancel()
+
+
+def build_environ(scope: dict, body: bytes) -> dict:
+    server_name, server_port = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope["query_string"].decode("latin-1"),
+        "SERVER_NAME": server_name,
+        "SERVER_PORT": str(server_port),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": scope["client"][0] if scope.get("client") else "",
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+    }
+    for name, value in read_headers(scope).items():
+        key = name.upper().replace("-", "_")
+        if key not in {"CONTENT_TYPE", "CONTENT_LENGTH"}:
+            key = f"HTTP_{key}"
+        environ[key] = value
+    return environ
+
+
+async def call_flask(scope: dict, receive: Callable[[], Awaitable[dict]], send: Callable[[dict], Awaitable[None]]) -> None:
+    """Run the request through the Flask app on the thread pool, streaming its body back."""
+    body = bytearray()
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            break
+
+    loop = asyncio.get_running_loop()
+    started: list = []
+
+    def start_response(status: str, headers: list[tuple[str, str]], exc_info=None) -> None:
+        started[:] = [int(status.split(" ", 1)[0]), headers]
+
+    result = await loop.run_in_executor(EXECUTOR, flask_app, build_environ(scope, bytes(body)), start_response)
+    chunks = iter(result)
+    try:
+        # Flask calls start_response before handing back the body iterator.
+        status, headers = started
+        await send(
+            {
+                "type": "http.response.start",
+                "status": status,
+                "headers": [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers],
+            }
+        )
+        while True:
+            chunk = await loop.run_in_executor(EXECUTOR, next, chunks, None)
+            if chunk is None:
+                break
+            if chunk:
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        await send({"type": "http.response.body", "body": b""})
+    finally:
+        if hasattr(result, "close"):
+            await loop.run_in_executor(EXECUTOR, result.close)
+
+
+async def lifespan(receive: Callable[[], Awaitable[dict]], send: Callable[[dict], Awaitable[None]]) -> None:
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            # The ASGI server owns SIGTERM and reports it as a shutdown below.
+            await asyncio.get_running_loop().run_in_executor(EXECUTOR, partial(start_serving, handle_signals=False))
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await asyncio.get_running_loop().run_in_executor(EXECUTOR, stop_serving)
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope: dict, receive: Callable[[], Awaitable[dict]], send: Callable[[dict], Awaitable[None]]) -> None:
+    if scope["type"] == "lifespan":
+        await lifespan(receive, send)
+        return
+    if scope["type"] != "http":
+        return
+
+    route = kind = None
+    if scope["method"] == "GET":
+        for pattern, rule, name in ROUTES:
+            match = pattern.fullmatch(scope["path"])
+            if match:
+                route, kind = rule, name
+                subject_id, topic_id = match.groups()
+                break
+    query = parse_qs(scope["query_string"].decode("latin-1"))
+    run_id = parse_run_id(query) if kind else None
+    if run_id is None:
+        await call_flask(scope, receive, send)
+        return
+
+    started = perf_counter()
+    headers = read_headers(scope)
+    streaming = kind.endswith("_events")
+    if streaming:
+        active_poll_id = None
+        if flask_app.config["EVENT_STREAMS"]:
+            active_poll_id, _ = await off_loop(get_active_topic_state, run_id, subject_id, topic_id)
+        if not active_poll_id:
+            await call_flask(scope, receive, send)
+            return
+    elif kind == "topic_entry" and "student" not in load_session(headers):
+        # A first view gives the student their session cookie, which stays Flask's job.
+        await call_flask(scope, receive, send)
+        return
+
+    admitted = admit(scope, kind, subject_id, headers)
+    if isinstance(admitted, tuple):
+        ADMISSION_SHED.inc(route, admitted[0])
+        response = admitted
+    elif streaming:
+        if admitted:
+            # An open stream counts against the client's rate, not against the requests in flight.
+            ADMISSION.release()
+        REQUEST_COUNT.inc(route, "GET", 200)
+        REQUEST_LATENCY.observe(perf_counter() - started, route)
+        await stream_events(receive, send, TopicStream(run_id, subject_id, topic_id, kind == "teacher_events"))
+        return
+    else:
+        try:
+            response = await off_loop(NATIVE_HANDLERS[kind], run_id, subject_id, topic_id, query, headers)
+        finally:
+            if admitted:
+                ADMISSION.release()
+    if response is None:
+        await call_flask(scope, receive, send)
+        return
+    status, response_headers, body = response
+    await send_response(send, status, response_headers, body)
+    REQUEST_COUNT.inc(route, "GET", status)
+    REQUEST_LATENCY.observe(perf_counter() - started, route)
+    RESPONSE_SIZE.observe(len(body), route)
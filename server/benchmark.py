@@ -0,0 +1,495 @@
+"""Local benchmarks for the poll server.
+
+Run from the ``server`` directory, for example::
+
+    python benchmark.py contention --threads 1 2 4 8
+    python benchmark.py terms --answers 10000 --language it
+    python benchmark.py workers --workers 1 2 4
+    python benchmark.py classroom --students 50 500 5000 --transport client server
+"""
+
+from argparse import ArgumentParser
+from collections import Counter
+import heapq
+from http.client import HTTPConnection
+import logging
+import multiprocessing
+import os
+from pathlib import Path
+from queue import SimpleQueue
+import random
+import resource
+import secrets
+import subprocess
+import sys
+import tempfile
+from threading import Barrier, Lock, Thread
+from time import perf_counter, process_time, sleep
+from urllib.parse import urlencode
+from uuid import uuid4
+
+from werkzeug.serving import make_server
+import yaml
+
+# Benchmarks measure the in-process store; keep them from writing to the results database.
+os.environ.setdefault("RESULTS_STORAGE", "memory")
+# The simulated students all share one address and answer faster than a phone would;
+# set ADMISSION_CONTROL=1 to measure shedding instead (shed requests are counted apart).
+os.environ.setdefault("ADMISSION_CONTROL", "0")
+
+import app as poll_app  # noqa: E402
+from results import TEXT_CLOUD_TERMS, ResultStore, intern_poll, percentile, poll_path  # noqa: E402
+from storage import ResultsStorage  # noqa: E402
+from text_terms import STOPWORDS, extract_terms  # noqa: E402
+
+BENCH_POLL = {
+    "id": "bench",
+    "subject": "bench",
+    "topic": "bench",
+    "answer_type": "single_choice",
+    "answers": ["A", "B", "C", "D"],
+}
+
+
+def submit_loop(run_id: str, submissions: int, barrier: Barrier) -> None:
+    answers = BENCH_POLL["answers"]
+    barrier.wait()
+    previous = None
+    for index in range(submissions):
+        answer = answers[index % len(answers)]
+        poll_app.record_submission(run_id, BENCH_POLL, answer, previous)
+        previous = answer
+
+
+def measure_contention(thread_count: int, submissions: int, shard_count: int) -> float:
+    """Return submissions per second with one run (class) per thread."""
+    poll_app.RESULT_STORE = ResultStore(shard_count, ResultsStorage(), poll_app.load_polls)
+    barrier = Barrier(thread_count + 1)
+    threads = [
+        Thread(target=submit_loop, args=(str(uuid4()), submissions, barrier))
+        for _ in range(thread_count)
+    ]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    started = perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = perf_counter() - started
+    return thread_count * submissions / elapsed
+
+
+def run_contention(args) -> None:
+    print(f"{'threads':>8} {'shards':>8} {'submissions/s':>15}")
+    for shard_count in (1, args.shards):
+        for thread_count in args.threads:
+            rate = measure_contention(thread_count, args.submissions, shard_count)
+            print(f"{thread_count:>8} {shard_count:>8} {rate:>15,.0f}")
+
+
+def generate_answers(count: int, language: str, seed: int = 0) -> list[str]:
+    """Essay-like answers drawn from a Zipf-ish vocabulary mixed with stopwords."""
+    rng = random.Random(seed)
+    vocabulary = [f"concept{index}" for index in range(2_000)]
+    weights = [1 / (rank + 1) for rank in range(len(vocabulary))]
+    stopwords = sorted(STOPWORDS[language])
+    answers = []
+    for _ in range(count):
+        words = rng.choices(vocabulary, weights, k=rng.randint(5, 60))
+        words += rng.choices(stopwords, k=len(words) // 2)
+        rng.shuffle(words)
+        answers.append(" ".join(words).capitalize() + ".")
+    return answers
+
+
+def run_terms(args) -> None:
+    poll = {"id": "bench", "subject": "bench", "topic": "bench", "answer_type": "text", "language": args.language}
+    run_id = str(uuid4())
+    answers = generate_answers(args.answers, args.language)
+    students = max(1, args.answers * 4 // 5)
+    previous: dict[int, str] = {}
+
+    started = perf_counter()
+    for index, answer in enumerate(answers):
+        # Every fifth submission replaces an earlier answer of the same student.
+        student = index % students
+        poll_app.record_submission(run_id, poll, answer, previous.get(student))
+        previous[student] = answer
+    ingest_elapsed = perf_counter() - started
+
+    entry = poll_app.RESULT_STORE.shard(run_id).runs[run_id].results[intern_poll(poll_path(poll))]
+    started = perf_counter()
+    for _ in range(args.reads):
+        entry.terms.most_common(TEXT_CLOUD_TERMS)
+    read_elapsed = (perf_counter() - started) / args.reads
+
+    started = perf_counter()
+    counter: Counter[str] = Counter()
+    for answer in previous.values():
+        counter.update(extract_terms(answer, args.language).keys())
+    counter.most_common(TEXT_CLOUD_TERMS)
+    recount_elapsed = perf_counter() - started
+
+    print(f"answers:               {args.answers:,} ({len(previous):,} current, {len(entry.terms.counts):,} terms)")
+    print(f"ingest:                {args.answers / ingest_elapsed:,.0f} answers/s")
+    print(f"top-{TEXT_CLOUD_TERMS} read (indexed): {read_elapsed * 1e6:,.1f} us")
+    print(f"full recount:          {recount_elapsed * 1e3:,.1f} ms")
+
+
+def submit_worker(run_id: str, seconds: float, start, results) -> None:
+    """Post answers to the first topic of the catalog as fresh students for ``seconds``."""
+    catalog = poll_app.get_poll_catalog()
+    subject_id, topic_id = next(iter(catalog.topic_poll_ids))
+    poll = catalog.polls_by_path[(subject_id, topic_id, catalog.topic_poll_ids[(subject_id, topic_id)][0])]
+    answers = poll.get("answers") or ["answer"]
+    field = "answer_text" if poll.get("answer_type") == "text" else "answer_choice"
+    client = poll_app.app.test_client(use_cookies=False)
+    url = f"/{subject_id}/{topic_id}?id={run_id}"
+
+    start.wait()
+    submissions = 0
+    cpu_start = process_time()
+    deadline = perf_counter() + seconds
+    while perf_counter() < deadline:
+        client.post(url, data={field: answers[submissions % len(answers)]})
+        submissions += 1
+    results.put((submissions, process_time() - cpu_start))
+
+
+def process_cpu_seconds(pid: int) -> float:
+    # User plus system time of another process, from /proc (Linux only).
+    fields = Path(f"/proc/{pid}/stat").read_text().rpartition(")")[2].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def run_workers(args) -> None:
+    context = multiprocessing.get_context("spawn")
+    address = str(Path(tempfile.mkdtemp()) / "state.sock")
+    os.environ.setdefault("SHARED_STATE_AUTHKEY", secrets.token_hex(16))
+    state_env = {**os.environ, "RESULTS_STORAGE": "memory"}
+    state_env.pop("SHARED_STATE_ADDRESS", None)
+    state_server = subprocess.Popen(
+        [sys.executable, "-m", "flask", "--app", "app", "serve-state", "--address", address],
+        env=state_env,
+        stdout=subprocess.DEVNULL,
+    )
+    while not Path(address).exists():
+        sleep(0.05)
+    # Spawned workers re-import this module, and with it app in shared mode.
+    os.environ["SHARED_STATE_ADDRESS"] = address
+
+    try:
+        # CPU per submission tells how far more cores could go: the workers'
+        # share spreads over them, the state server's stays on one core.
+        print(f"{'workers':>8} {'submissions/s':>15} {'speedup':>8} {'worker us':>10} {'state us':>9} {'state-bound/s':>14}")
+        baseline = None
+        for worker_count in args.workers:
+            start = context.Event()
+            results = context.Queue()
+            run_id = str(uuid4())
+            processes = [
+                context.Process(target=submit_worker, args=(run_id, args.seconds, start, results))
+                for _ in range(worker_count)
+            ]
+            for process in processes:
+                process.start()
+            sleep(args.warmup)
+            state_cpu = process_cpu_seconds(state_server.pid)
+            start.set()
+            reports = [results.get() for _ in processes]
+            state_cpu = process_cpu_seconds(state_server.pid) - state_cpu
+            for process in processes:
+                process.join()
+            total = sum(submissions for submissions, _ in reports)
+            worker_us = sum(cpu for _, cpu in reports) / total * 1e6
+            state_us = state_cpu / total * 1e6
+            rate = total / args.seconds
+            baseline = baseline or rate
+            print(
+                f"{worker_count:>8} {rate:>15,.0f} {rate / baseline:>7.2f}x"
+                f" {worker_us:>10,.0f} {state_us:>9,.0f} {1e6 / state_us if state_us else float('inf'):>14,.0f}"
+            )
+    finally:
+        os.environ.pop("SHARED_STATE_ADDRESS", None)
+        state_server.terminate()
+        state_server.wait()
+
+
+def generate_catalog(path: Path, subjects: int, topics: int, polls: int, options: int) -> None:
+    """Write a polls.yml with ``subjects * topics * polls`` polls of mixed answer types."""
+    answer_types = ("single_choice", "multiple_choice", "text")
+    data = {
+        "subjects": [
+            {
+                "id": f"subject{subject}",
+                "language": ("en", "de", "it")[subject % 3],
+                "topics": [
+                    {
+                        "id": f"topic{topic}",
+                        "polls": [
+                            {
+                                "id": f"poll{poll}",
+                                "question": f"Generated question {poll} of topic {topic}?",
+                                "answer_type": answer_types[poll % len(answer_types)],
+                                "answers": [f"Option {option}" for option in range(options)],
+                            }
+                            for poll in range(polls)
+                        ],
+                    }
+                    for topic in range(topics)
+                ],
+            }
+            for subject in range(subjects)
+        ]
+    }
+    path.write_text(yaml.safe_dump(data, sort_keys=False), encoding="utf-8")
+
+
+class TestClientTransport:
+    """Requests through Flask's test client: the app's cost without any HTTP server."""
+
+    def __init__(self) -> None:
+        self.client = poll_app.app.test_client(use_cookies=False)
+
+    def request(self, method: str, url: str, headers: dict, form: dict | None = None) -> tuple[int, str | None]:
+        response = self.client.open(url, method=method, headers=headers, data=form)
+        return response.status_code, response.headers.get("Set-Cookie")
+
+
+class HTTPTransport:
+    """Requests over HTTP to a local WSGI server, one keep-alive connection per worker."""
+
+    def __init__(self, port: int) -> None:
+        self.connection = HTTPConnection("127.0.0.1", port, timeout=30)
+
+    def request(self, method: str, url: str, headers: dict, form: dict | None = None) -> tuple[int, str | None]:
+        body = None
+        if form is not None:
+            body = urlencode(form, doseq=True)
+            headers = {**headers, "Content-Type": "application/x-www-form-urlencoded"}
+        self.connection.request(method, url, body=body, headers=headers)
+        response = self.connection.getresponse()
+        response.read()
+        return response.status, response.getheader("Set-Cookie")
+
+
+class Classroom:
+    """Simulated classes: students syncing and answering, teachers watching results.
+
+    Every student of a class syncs the active poll every ``sync_seconds`` (as
+    poll.html does), and all of them submit once within ``burst_window``
+    seconds of ``burst_at``. Each class's teacher polls the topic results with
+    If-None-Match on the same interval. Requests are scheduled at fixed times
+    and run by a pool of worker threads; ``lag`` is how late a request started,
+    which grows once the server cannot keep up.
+    """
+
+    def __init__(self, args, topics: list[tuple[str, str, list[dict]]]) -> None:
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.classes = [
+            (str(uuid4()), *topics[index % len(topics)]) for index in range(max(1, args.classes))
+        ]
+        self.cookies: dict[int, str] = {}
+        self.etags: dict[int, str] = {}
+        self.latencies: dict[str, list[float]] = {}
+        self.lags: list[float] = []
+        self.errors = 0
+        self.shed = 0
+        self.lock = Lock()
+
+    def schedule(self) -> list[tuple[float, int, str, int]]:
+        args = self.args
+        tasks = []
+        for student in range(args.students):
+            offset = self.rng.uniform(0, args.sync_seconds)
+            tasks += [(offset + tick * args.sync_seconds, "sync", student) for tick in range(int(args.duration / args.sync_seconds))]
+            tasks.append((args.burst_at + self.rng.uniform(0, args.burst_window), "submit", student))
+        for teacher in range(len(self.classes)):
+            tasks += [(tick * args.sync_seconds, "teacher", teacher) for tick in range(int(args.duration / args.sync_seconds))]
+        return sorted((due, sequence, kind, who) for sequence, (due, kind, who) in enumerate(tasks))
+
+    def perform(self, transport, kind: str, who: int) -> None:
+        if kind == "teacher":
+            run_id, subject_id, topic_id, _ = self.classes[who]
+            headers = {"If-None-Match": self.etags[who]} if who in self.etags else {}
+            status, _ = transport.request("GET", f"/api/teacher/{subject_id}/{topic_id}/results?id={run_id}", headers)
+            expected = (200, 304)
+        else:
+            run_id, subject_id, topic_id, polls = self.classes[who % len(self.classes)]
+            headers = {"Cookie": self.cookies[who]} if who in self.cookies else {}
+            if kind == "sync":
+                status, _ = transport.request("GET", f"/api/student/{subject_id}/{topic_id}/active?id={run_id}", headers)
+                expected = (200, 304)
+            else:
+                # The active poll is the topic's first until a teacher picks another.
+                poll = polls[0]
+                answers = poll.get("answers") or ["answer"]
+                if poll["answer_type"] == "text":
+                    form = {"answer_text": " ".join(self.rng.choices(answers, k=3))}
+                elif poll["answer_type"] == "multiple_choice":
+                    form = {"answer_choices": self.rng.sample(answers, k=min(2, len(answers)))}
+                else:
+                    form = {"answer_choice": self.rng.choice(answers)}
+                status, cookie = transport.request("POST", f"/{subject_id}/{topic_id}?id={run_id}", headers, form)
+                if cookie:
+                    self.cookies[who] = cookie.split(";", 1)[0]
+                expected = (200,)
+        if status in (429, 503):
+            with self.lock:
+                self.shed += 1
+        elif status not in expected:
+            with self.lock:
+                self.errors += 1
+
+    def run(self, transport_factory) -> float:
+        tasks = self.schedule()
+        queue: SimpleQueue = SimpleQueue()
+
+        def work() -> None:
+            transport = transport_factory()
+            while (task := queue.get()) is not None:
+                due, kind, who = task
+                started = perf_counter()
+                self.perform(transport, kind, who)
+                elapsed = perf_counter() - started
+                with self.lock:
+                    self.latencies.setdefault(kind, []).append(elapsed)
+                    self.lags.append(max(0.0, started - due))
+
+        workers = [Thread(target=work, daemon=True) for _ in range(self.args.concurrency)]
+        for worker in workers:
+            worker.start()
+        begin = perf_counter()
+        heapq.heapify(tasks)
+        while tasks:
+            due, _, kind, who = heapq.heappop(tasks)
+            delay = begin + due - perf_counter()
+            if delay > 0:
+                sleep(delay)
+            queue.put((begin + due, kind, who))
+        for _ in workers:
+            queue.put(None)
+        for worker in workers:
+            worker.join()
+        return perf_counter() - begin
+
+
+def classroom_worker(args, transport_name: str, results) -> None:
+    """Run one classroom configuration in a fresh process, so peak RSS is its own."""
+    catalog_path = Path(tempfile.mkdtemp()) / "polls.yml"
+    generate_catalog(catalog_path, args.subjects, args.topics, args.polls, args.options)
+    poll_app.POLL_FILE = catalog_path
+    catalog = poll_app.reload_poll_catalog()
+    topics = [
+        (subject_id, topic_id, [catalog.polls_by_path[(subject_id, topic_id, poll_id)] for poll_id in poll_ids])
+        for (subject_id, topic_id), poll_ids in catalog.topic_poll_ids.items()
+    ]
+
+    classroom = Classroom(args, topics)
+    server = None
+    if transport_name == "server":
+        logging.getLogger("werkzeug").setLevel(logging.ERROR)
+        server = make_server("127.0.0.1", 0, poll_app.app, threaded=True)
+        Thread(target=server.serve_forever, daemon=True).start()
+        elapsed = classroom.run(lambda: HTTPTransport(server.server_port))
+        server.shutdown()
+    else:
+        elapsed = classroom.run(TestClientTransport)
+    if poll_app.SUBMISSION_INGESTOR is not None:
+        poll_app.SUBMISSION_INGESTOR.flush()
+
+    summary = {
+        "requests": sum(len(latencies) for latencies in classroom.latencies.values()),
+        "elapsed": elapsed,
+        "errors": classroom.errors,
+        "shed": classroom.shed,
+        "lag_p99": percentile(sorted(classroom.lags), 0.99),
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "kinds": {},
+    }
+    for kind, latencies in classroom.latencies.items():
+        latencies.sort()
+        summary["kinds"][kind] = [percentile(latencies, fraction) for fraction in (0.50, 0.95, 0.99)]
+    results.put(summary)
+
+
+def run_classroom(args) -> None:
+    context = multiprocessing.get_context("spawn")
+    polls = args.subjects * args.topics * args.polls
+    print(f"catalog: {polls:,} polls, {args.options} options each; {args.classes} class(es); {args.duration:.0f}s per run")
+    print(
+        f"{'transport':>9} {'students':>8} {'req/s':>8} {'errors':>6} {'shed':>6} {'lag p99':>8} {'rss MB':>7}"
+        f"  {'request':<8} {'p50 ms':>7} {'p95 ms':>7} {'p99 ms':>7}"
+    )
+    for transport_name in args.transport:
+        for students in args.students:
+            results = context.Queue()
+            config = type(args)(**{**vars(args), "students": students})
+            process = context.Process(target=classroom_worker, args=(config, transport_name, results))
+            process.start()
+            summary = results.get()
+            process.join()
+            head = (
+                f"{transport_name:>9} {students:>8,} {summary['requests'] / summary['elapsed']:>8,.0f} "
+                f"{summary['errors']:>6} {summary['shed']:>6} "
+                f"{summary['lag_p99'] * 1e3:>6.0f}ms {summary['peak_rss_mb']:>7.1f}"
+            )
+            for kind, (p50, p95, p99) in sorted(summary["kinds"].items()):
+                print(f"{head}  {kind:<8} {p50 * 1e3:>7.2f} {p95 * 1e3:>7.2f} {p99 * 1e3:>7.2f}")
+                head = " " * len(head)
+
+
+def main() -> None:
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    contention = commands.add_parser(
+        "contention",
+        help="submission throughput with a single lock vs. striped result shards",
+    )
+    contention.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4, 8])
+    contention.add_argument("--submissions", type=int, default=50_000, help="submissions per thread")
+    contention.add_argument("--shards", type=int, default=poll_app.RESULT_SHARD_COUNT)
+    contention.set_defaults(handler=run_contention)
+
+    terms = commands.add_parser("terms", help="text-answer ingestion and word-cloud read cost")
+    terms.add_argument("--answers", type=int, default=10_000)
+    terms.add_argument("--language", choices=poll_app.SUPPORTED_LOCALES, default="en")
+    terms.add_argument("--reads", type=int, default=1_000)
+    terms.set_defaults(handler=run_terms)
+
+    workers = commands.add_parser(
+        "workers",
+        help="student submissions through the Flask app with N worker processes sharing one state server",
+    )
+    workers.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    workers.add_argument("--seconds", type=float, default=5.0)
+    workers.add_argument("--warmup", type=float, default=2.0, help="seconds to let workers import and connect")
+    workers.set_defaults(handler=run_workers)
+
+    classroom = commands.add_parser(
+        "classroom",
+        help="simulated classes of students syncing and submitting while teachers watch results",
+    )
+    classroom.add_argument("--students", type=int, nargs="+", default=[50, 500, 5000])
+    classroom.add_argument("--transport", choices=("client", "server"), nargs="+", default=["client", "server"])
+    classroom.add_argument("--classes", type=int, default=1, help="runs the students are spread over")
+    classroom.add_argument("--duration", type=float, default=20.0, help="simulated seconds per configuration")
+    classroom.add_argument("--sync-seconds", type=float, default=2.0, help="student and teacher polling interval")
+    classroom.add_argument("--burst-at", type=float, default=5.0, help="second at which everyone submits")
+    classroom.add_argument("--burst-window", type=float, default=1.0)
+    classroom.add_argument("--concurrency", type=int, default=32, help="client threads issuing requests")
+    classroom.add_argument("--subjects", type=int, default=10)
+    classroom.add_argument("--topics", type=int, default=20)
+    classroom.add_argument("--polls", type=int, default=10, help="polls per topic")
+    classroom.add_argument("--options", type=int, default=6)
+    classroom.add_argument("--seed", type=int, default=0)
+    classroom.set_defaults(handler=run_classroom)
+
+    args = parser.parse_args()
+    args.handler(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+"""Validate and precompile polls.yml.
+
+The server compiles the poll file when it starts and whenever the file
+changes: the YAML is checked against the schema below, so a poll without
+answers or with an unknown answer type is reported up front instead of
+failing a request later. The validated data is written to a pickle cache keyed
+by the file's SHA-256, so the next start (or the next worker) loads it in
+milliseconds instead of parsing YAML again.
+
+Check a file, and refresh its cache, without starting the server::
+
+    python catalog.py ../polls.yml
+    python catalog.py --check ../polls.yml    # validate only
+"""
+
+from argparse import ArgumentParser
+from collections.abc import Mapping
+import hashlib
+import logging
+import os
+from pathlib import Path
+import pickle
+import sys
+import tempfile
+
+import yaml
+
+ANSWER_TYPES = ("single_choice", "multiple_choice", "text")
+CHOICE_ANSWER_TYPES = ("single_choice", "multiple_choice")
+# Bump when the cached data would no longer match what the server expects.
+CACHE_FORMAT = 1
+# libyaml's parser is several times faster than the pure-Python one when PyYAML was built with it.
+YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+logger = logging.getLogger(__name__)
+
+
+class CatalogError(ValueError):
+    """polls.yml failed to parse or validate; ``errors`` lists every problem found."""
+
+    def __init__(self, errors: list[str]) -> None:
+        super().__init__("invalid poll file:\n" + "\n".join(f"  - {error}" for error in errors))
+        self.errors = errors
+
+
+def check_id(value, where: str, errors: list[str]) -> bool:
+    # Poll paths are joined with "/" (and older result keys with "|"), so ids may not contain them.
+    if not isinstance(value, str) or not value:
+        errors.append(f"{where}: id must be a non-empty string")
+        return False
+    if "/" in value or "|" in value:
+        errors.append(f"{where}: id {value!r} may not contain '/' or '|'")
+        return False
+    return True
+
+
+def check_list(value, where: str, errors: list[str]) -> list:
+    if value is None:
+        return []
+    if not isinstance(value, list):
+        errors.append(f"{where} must be a list")
+        return []
+    return value
+
+
+def validate_poll(poll, where: str, errors: list[str]) -> None:
+    if not isinstance(poll, Mapping):
+        errors.append(f"{where} must be a mapping")
+        return
+    question = poll.get("question")
+    if not isinstance(question, str) or not question.strip():
+        errors.append(f"{where}: question must be a non-empty string")
+    answer_type = poll.get("answer_type")
+    if answer_type not in ANSWER_TYPES:
+        errors.append(f"{where}: answer_type must be one of {', '.join(ANSWER_TYPES)}, not {answer_type!r}")
+    if answer_type in CHOICE_ANSWER_TYPES:
+        answers = poll.get("answers")
+        if not isinstance(answers, list) or not answers:
+            errors.append(f"{where}: a {answer_type} poll needs a non-empty answers list")
+        elif not all(isinstance(answer, str) and answer for answer in answers):
+            errors.append(f"{where}: answers must be non-empty strings")
+        elif len(set(answers)) != len(answers):
+            errors.append(f"{where}: answers must be unique")
+
+
+def validate_polls(polls: list, where: str, errors: list[str]) -> None:
+    seen: set[str] = set()
+    for position, poll in enumerate(polls):
+        poll_where = f"{where} poll #{position + 1}"
+        poll_id = poll.get("id") if isinstance(poll, Mapping) else None
+        if check_id(poll_id, poll_where, errors):
+            poll_where = f"{where}/{poll_id}"
+            if poll_id in seen:
+                errors.append(f"{poll_where}: duplicate poll id")
+            seen.add(poll_id)
+        validate_poll(poll, poll_where, errors)
+
+
+def validate_poll_data(data) -> list[str]:
+    """Return every schema problem in parsed polls.yml ``data``; an empty list means it is valid."""
+    if data is None:
+        return []
+    if not isinstance(data, Mapping):
+        return ["the top level must be a mapping with 'subjects' (or 'polls')"]
+    errors: list[str] = []
+    # The flat top-level list lands in the "general/general" topic.
+    validate_polls(check_list(data.get("polls"), "polls", errors), "general/general", errors)
+
+    subject_ids: set[str] = set()
+    for subject_position, subject in enumerate(check_list(data.get("subjects"), "subjects", errors)):
+        where = f"subject #{subject_position + 1}"
+        if not isinstance(subject, Mapping):
+            errors.append(f"{where} must be a mapping")
+            continue
+        subject_id = subject.get("id")
+        if check_id(subject_id, where, errors):
+            where = subject_id
+            if subject_id in subject_ids:
+                errors.append(f"{where}: duplicate subject id")
+            subject_ids.add(subject_id)
+        language = subject.get("language")
+        if language is not None and not isinstance(language, str):
+            errors.append(f"{where}: language must be a string")
+
+        topic_ids: set[str] = set()
+        for topic_position, topic in enumerate(check_list(subject.get("topics"), f"{where}: topics", errors)):
+            topic_where = f"{where} topic #{topic_position + 1}"
+            if not isinstance(topic, Mapping):
+                errors.append(f"{topic_where} must be a mapping")
+                continue
+            topic_id = topic.get("id")
+            if check_id(topic_id, topic_where, errors):
+                topic_where = f"{where}/{topic_id}"
+                if topic_id in topic_ids:
+                    errors.append(f"{topic_where}: duplicate topic id")
+                topic_ids.add(topic_id)
+            validate_polls(check_list(topic.get("polls"), f"{topic_where}: polls", errors), topic_where, errors)
+    return errors
+
+
+def parse_poll_source(raw: bytes):
+    try:
+        data = yaml.load(raw, Loader=YAML_LOADER)
+    except yaml.YAMLError as error:
+        raise CatalogError([f"YAML syntax: {error}"]) from None
+    errors = validate_poll_data(data)
+    if errors:
+        raise CatalogError(errors)
+    return data or {}
+
+
+def read_cache(cache_path: Path | None, digest: str) -> dict | None:
+    """Return the cached data compiled from a source with ``digest``, if there is one."""
+    if cache_path is None:
+        return None
+    try:
+        with cache_path.open("rb") as cache_file:
+            cached = pickle.load(cache_file)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ValueError):
+        return None
+    if not isinstance(cached, dict) or cached.get("format") != CACHE_FORMAT or cached.get("digest") != digest:
+        return None
+    return cached["data"]
+
+
+def write_cache(cache_path: Path, digest: str, data: dict) -> None:
+    """Write the cache atomically, so a concurrent reader sees the old file or the new one."""
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    handle, temporary = tempfile.mkstemp(dir=cache_path.parent, prefix=f".{cache_path.name}.")
+    try:
+        with os.fdopen(handle, "wb") as cache_file:
+            pickle.dump({"format": CACHE_FORMAT, "digest": digest, "data": data}, cache_file, pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary, cache_path)
+    except BaseException:
+        Path(temporary).unlink(missing_ok=True)
+        raise
+
+
+def compile_poll_source(raw: bytes, cache_path: Path | None = None) -> tuple[str, dict, bool]:
+    """Return ``(digest, data, from_cache)`` for polls.yml contents ``raw``.
+
+    Raises ``CatalogError`` if the source does not validate. A cache that
+    cannot be written is not an error; the next compile parses again.
+    """
+    digest = hashlib.sha256(raw).hexdigest()
+    data = read_cache(cache_path, digest)
+    if data is not None:
+        return digest, data, True
+    data = parse_poll_source(raw)
+    if cache_path is not None:
+        try:
+            write_cache(cache_path, digest, data)
+        except OSError as error:
+            logger.warning("Could not write poll cache %s: %s", cache_path, error)
+    return digest, data, False
+
+
+def default_cache_path(source: Path) -> Path:
+    return source.with_name(f".{source.name}.cache")
+
+
+def main() -> None:
+    parser = ArgumentParser(description="Validate polls.yml and write its compiled cache.")
+    parser.add_argument("source", nargs="?", type=Path, default=Path(__file__).resolve().parent.parent / "polls.yml")
+    parser.add_argument("--cache", type=Path, help="Cache file to write (default: .<source name>.cache next to it).")
+    parser.add_argument("--check", action="store_true", help="Only validate; do not read or write the cache.")
+    args = parser.parse_args()
+
+    raw = args.source.read_bytes()
+    try:
+        if args.check:
+            data = parse_poll_source(raw)
+        else:
+            _, data, _ = compile_poll_source(raw, args.cache or default_cache_path(args.source))
+    except CatalogError as error:
+        sys.exit(f"{args.source}: {error}")
+    subjects = data.get("subjects") or []
+    topics = [topic for subject in subjects for topic in subject.get("topics") or []]
+    polls = len(data.get("polls") or []) + sum(len(topic.get("polls") or []) for topic in topics)
+    print(f"{args.source}: {polls} polls in {len(topics)} topics of {len(subjects)} subjects are valid")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Streaming encoders for result exports.
+
+Rows go in as an iterator of dicts and come out as an iterator of text chunks,
+optionally gzip-compressed as they are produced, so an export of any size is
+written with a few kilobytes of buffer.
+"""
+
+from collections.abc import Iterable, Iterator, Mapping
+import csv
+from io import StringIO
+import json
+import zlib
+
+EXPORT_COLUMNS = (
+    "run",
+    "run_created",
+    "subject",
+    "topic",
+    "poll",
+    "question",
+    "answer_type",
+    "answer",
+    "count",
+    "total_responses",
+)
+CHUNK_SIZE = 64 * 1024
+
+
+def csv_chunks(rows: Iterable[Mapping], columns: tuple[str, ...] = EXPORT_COLUMNS) -> Iterator[str]:
+    buffer = StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=columns, extrasaction="ignore")
+    writer.writeheader()
+    for row in rows:
+        writer.writerow(row)
+        if buffer.tell() >= CHUNK_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def ndjson_chunks(rows: Iterable[Mapping], columns: tuple[str, ...] = EXPORT_COLUMNS) -> Iterator[str]:
+    lines = []
+    size = 0
+    for row in rows:
+        line = json.dumps({column: row.get(column) for column in columns}, ensure_ascii=False, separators=(",", ":"))
+        lines.append(line)
+        size += len(line) + 1
+        if size >= CHUNK_SIZE:
+            yield "\n".join(lines) + "\n"
+            lines = []
+            size = 0
+    if lines:
+        yield "\n".join(lines) + "\n"
+
+
+# format -> (content type, file extension, encoder)
+EXPORT_FORMATS = {
+    "csv": ("text/csv; charset=utf-8", "csv", csv_chunks),
+    "ndjson": ("application/x-ndjson", "ndjson", ndjson_chunks),
+}
+
+
+def encode_chunks(chunks: Iterable[str]) -> Iterator[bytes]:
+    for chunk in chunks:
+        if chunk:
+            yield chunk.encode("utf-8")
+
+
+def gzip_chunks(chunks: Iterable[bytes], level: int = 6) -> Iterator[bytes]:
+    # wbits=31 writes a gzip header and trailer around the deflate stream.
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
@@ -0,0 +1,60 @@
+"""Gunicorn settings for running the poll server with several worker processes.
+
+Run from the ``server`` directory::
+
+    gunicorn -c gunicorn.conf.py
+
+Before forking the workers, the master starts ``flask serve-state``. That one
+process owns the results store and its persistence; the workers reach it
+through the Unix socket in SHARED_STATE_ADDRESS, authenticated with the
+key in SHARED_STATE_AUTHKEY, which must be set.
+
+The workers are uvicorn's and serve ``asgi:app``. An open event stream holds
+its connection for as long as the page stays open; on a thread-per-request
+worker (gthread, sync) a handful of open pages take every thread and answers
+and teacher requests queue behind them. On the event loop a stream is a
+coroutine, and Flask requests run on ASGI_THREADS threads beside it.
+"""
+
+import os
+from pathlib import Path
+import subprocess
+import sys
+import time
+
+SERVER_DIR = Path(__file__).resolve().parent
+STATE_ADDRESS = os.getenv("SHARED_STATE_ADDRESS", "/tmp/tellme-state.sock")
+
+bind = os.getenv("BIND", "0.0.0.0:5001")
+workers = int(os.getenv("WEB_CONCURRENCY", str(os.cpu_count() or 1)))
+worker_class = "uvicorn.workers.UvicornWorker"
+wsgi_app = "asgi:app"
+# Threads per worker for the requests asgi.py hands to Flask.
+os.environ.setdefault("ASGI_THREADS", os.getenv("THREADS", "8"))
+# Let student traffic occupy at most the threads minus the teacher reserve (see app.py).
+os.environ.setdefault("ADMISSION_MAX_IN_FLIGHT", os.environ["ASGI_THREADS"])
+chdir = str(SERVER_DIR)
+
+
+def on_starting(server):
+    if not os.getenv("SHARED_STATE_AUTHKEY"):
+        raise RuntimeError("set SHARED_STATE_AUTHKEY: the workers authenticate to the state server with it")
+    Path(STATE_ADDRESS).unlink(missing_ok=True)
+    state_env = {key: value for key, value in os.environ.items() if key != "SHARED_STATE_ADDRESS"}
+    server.state_process = subprocess.Popen(
+        [sys.executable, "-m", "flask", "--app", "app", "serve-state", "--address", STATE_ADDRESS],
+        cwd=SERVER_DIR,
+        env=state_env,
+    )
+    deadline = time.monotonic() + 30
+    while not Path(STATE_ADDRESS).exists():
+        if server.state_process.poll() is not None or time.monotonic() > deadline:
+            raise RuntimeError("shared state server failed to start")
+        time.sleep(0.1)
+    # Workers are forked from the master and inherit this.
+    os.environ["SHARED_STATE_ADDRESS"] = STATE_ADDRESS
+
+
+def on_exit(server):
+    server.state_process.terminate()
+    server.state_process.wait(timeout=30)
@@ -0,0 +1,76 @@
+"""Opt-in sampling profiler that can be switched on and off while serving.
+
+A background thread wakes every ``interval`` seconds, grabs the current stack
+of every other thread and counts it in folded form (``outer;inner;leaf``), the
+input format of flame graph tools. Nothing runs while it is stopped.
+"""
+
+from collections import Counter
+import sys
+from threading import Event, Lock, Thread, get_ident
+from time import monotonic
+
+
+class SamplingProfiler:
+    def __init__(self, max_depth: int = 64) -> None:
+        self.max_depth = max_depth
+        self.interval = 0.0
+        self.samples = 0
+        self.started_at: float | None = None
+        self._stacks: Counter[str] = Counter()
+        self._lock = Lock()
+        self._stop = Event()
+        self._thread: Thread | None = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval: float = 0.01) -> None:
+        with self._lock:
+            if self.running:
+                self.interval = interval
+                return
+            self.interval = interval
+            self._stacks.clear()
+            self.samples = 0
+            self.started_at = monotonic()
+            self._stop.clear()
+            self._thread = Thread(target=self._sample_loop, name="sampling-profiler", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        thread = self._thread
+        if thread is None:
+            return
+        self._stop.set()
+        thread.join()
+
+    def folded(self, limit: int | None = None) -> list[tuple[str, int]]:
+        with self._lock:
+            return self._stacks.most_common(limit)
+
+    def status(self) -> dict:
+        return {
+            "running": self.running,
+            "interval": self.interval,
+            "samples": self.samples,
+            "seconds": round(monotonic() - self.started_at, 3) if self.started_at is not None else 0.0,
+        }
+
+    def _sample_loop(self) -> None:
+        own_thread = get_ident()
+        while not self._stop.wait(self.interval):
+            stacks = []
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_thread:
+                    continue
+                names = []
+                while frame is not None and len(names) < self.max_depth:
+                    code = frame.f_code
+                    names.append(f"{code.co_name} ({code.co_filename.rpartition('/')[2]}:{frame.f_lineno})")
+                    frame = frame.f_back
+                stacks.append(";".join(reversed(names)))
+            with self._lock:
+                self._stacks.update(stacks)
+                self.samples += 1
@@ -0,0 +1,1305 @@
+"""The results store: answers, topic selections and student ledgers of every run.
+
+``ResultStore`` keeps each run (one class session) in memory as a ``RunState``,
+striped over shards by run id so classes running at the same time do not wait
+on each other. Every change is logged to a ``storage`` backend (see
+storage.py) and replayed after a restart. ``SharedResultStore`` is the client
+worker processes use to reach one store served by ``flask serve-state``, and
+``SubmissionIngestor`` applies queued student submissions to a store in
+batches.
+
+Polls are the catalog's mappings; the store keys results by process-wide poll
+numbers (``intern_poll``) and never reads polls.yml itself.
+"""
+
+from array import array
+from bisect import bisect_left, insort
+from collections import deque
+from collections.abc import Callable, Iterable, Mapping
+from functools import lru_cache
+import logging
+from multiprocessing.managers import BaseManager
+from queue import Empty, SimpleQueue
+import sys
+from threading import Event, Lock, Thread
+from time import monotonic, sleep, time
+import zlib
+
+from storage import ResultsStorage
+from text_terms import extract_terms
+from timeline import SubmissionTimeline
+
+TEXT_CLOUD_TERMS = 40
+RUN_EVICTION_INTERVAL_SECONDS = 60.0
+
+logger = logging.getLogger(__name__)
+
+
+# Process-wide poll numbers. They only ever grow, so a number keeps naming the
+# same poll across catalog reloads; results and ledgers are keyed by them.
+POLL_NUMBERS: dict[tuple[str, str, str], int] = {}
+POLL_PATHS: list[tuple[str, str, str]] = []
+POLL_NUMBERS_LOCK = Lock()
+
+
+def intern_poll(path: tuple[str, str, str]) -> int:
+    number = POLL_NUMBERS.get(path)
+    if number is None:
+        with POLL_NUMBERS_LOCK:
+            number = POLL_NUMBERS.get(path)
+            if number is None:
+                number = POLL_NUMBERS[path] = len(POLL_PATHS)
+                POLL_PATHS.append(path)
+    return number
+
+
+def poll_path(poll: Mapping) -> tuple[str, str, str]:
+    return poll.get("subject"), poll.get("topic"), poll.get("id")
+
+
+def build_topic_key(run_id: str, subject_id: str, topic_id: str) -> str:
+    return f"{run_id}|{subject_id}/{topic_id}"
+
+
+class RunState:
+    """Everything one run (one class session) keeps in memory.
+
+    ``version`` counts the run's applied submissions; each entry records in
+    ``changed_at`` the run version of its last change, so clients can ask for
+    what changed since the version they last saw.
+    """
+
+    __slots__ = ("created", "last_active", "version", "results", "active_polls", "active_versions", "ledger")
+
+    def __init__(self, created: float | None = None, last_active: float | None = None) -> None:
+        self.created = created or time()
+        self.last_active = last_active or self.created
+        self.version = 0
+        self.results: dict[int, ResultEntry] = {}
+        self.active_polls: dict[str, str] = {}
+        self.active_versions: dict[str, int] = {}
+        # student token -> poll number -> encoded answer
+        self.ledger: dict[str, dict[int, int | str]] = {}
+
+    def touch(self) -> None:
+        self.last_active = time()
+
+
+def shard_index(run_id: str, shard_count: int) -> int:
+    # Not hash(): snapshots are taken per shard, and str hashes change with every process.
+    return zlib.crc32(run_id.encode()) % shard_count
+
+
+class ResultShard:
+    """One stripe of the results store.
+
+    Everything belonging to a run lives in the same shard, so classes running at
+    the same time only contend when their run ids hash to the same stripe. The
+    results, selection and ledger locks guard the matching fields of the shard's
+    runs; ``runs_lock`` guards adding and removing runs and is always taken last.
+    ``rollups`` holds this shard's share of the cross-run rollups (poll number ->
+    bucket start -> rollup) and is guarded by ``results_lock``.
+    """
+
+    __slots__ = ("results_lock", "selection_lock", "ledger_lock", "runs_lock", "runs", "rollups")
+
+    def __init__(self, make_lock: Callable[[str], Lock] = lambda name: Lock()) -> None:
+        self.results_lock = make_lock("results")
+        self.selection_lock = make_lock("selection")
+        self.ledger_lock = make_lock("ledger")
+        self.runs_lock = make_lock("runs")
+        self.runs: dict[str, RunState] = {}
+        self.rollups: dict[int, dict[int, Rollup]] = {}
+
+    def all_locks(self) -> tuple[Lock, ...]:
+        return (self.results_lock, self.selection_lock, self.ledger_lock, self.runs_lock)
+
+
+class TermIndex:
+    """Term counts plus a count -> terms index, so the top K terms read in O(K).
+
+    ``buckets`` maps each occurring count to the terms that currently have it and
+    ``bucket_counts`` keeps those counts sorted. A submission moves one term to
+    the neighbouring bucket instead of re-sorting every distinct answer.
+    ``labels`` holds the display form of each term (its first surface form).
+    """
+
+    __slots__ = ("counts", "labels", "buckets", "bucket_counts")
+
+    def __init__(self) -> None:
+        self.counts: dict[str, int] = {}
+        self.labels: dict[str, str] = {}
+        self.buckets: dict[int, dict[str, None]] = {}
+        self.bucket_counts: list[int] = []
+
+    def _move(self, term: str, old_count: int, new_count: int) -> None:
+        if old_count:
+            bucket = self.buckets[old_count]
+            del bucket[term]
+            if not bucket:
+                del self.buckets[old_count]
+                del self.bucket_counts[bisect_left(self.bucket_counts, old_count)]
+        if new_count:
+            bucket = self.buckets.get(new_count)
+            if bucket is None:
+                bucket = self.buckets[new_count] = {}
+                insort(self.bucket_counts, new_count)
+            bucket[term] = None
+            self.counts[term] = new_count
+        else:
+            self.counts.pop(term, None)
+            self.labels.pop(term, None)
+
+    def add(self, term: str, occurrences: int = 1, label: str | None = None) -> None:
+        if term and occurrences > 0:
+            count = self.counts.get(term, 0)
+            if not count:
+                self.labels[term] = label or term
+            self._move(term, count, count + occurrences)
+
+    def discard(self, term: str, occurrences: int = 1) -> None:
+        count = self.counts.get(term, 0)
+        if count and occurrences > 0:
+            self._move(term, count, max(0, count - occurrences))
+
+    def most_common(self, limit: int) -> list[tuple[str, int]]:
+        terms = []
+        for count in reversed(self.bucket_counts):
+            for term in self.buckets[count]:
+                terms.append((self.labels[term], count))
+                if len(terms) >= limit:
+                    return terms
+        return terms
+
+
+def add_answer_terms(terms: TermIndex, answer: str, language: str, occurrences: int = 1) -> None:
+    for term, label in extract_terms(answer, language).items():
+        terms.add(term, occurrences, label)
+
+
+def discard_answer_terms(terms: TermIndex, answer: str, language: str) -> None:
+    for term in extract_terms(answer, language):
+        terms.discard(term)
+
+
+def poll_language(poll: Mapping) -> str:
+    # The catalog stores normalized languages; polls built by hand may leave it out.
+    return poll.get("language") or "en"
+
+
+@lru_cache(maxsize=4096)
+def option_positions(options: tuple[str, ...]) -> dict[str, int]:
+    return {option: position for position, option in enumerate(options)}
+
+
+class ResultEntry:
+    """Results of one poll in one run.
+
+    Choice counts live in an ``array('l')`` indexed by option position, in the
+    order of ``options``; text polls keep their answers and term index instead.
+    ``options`` is the catalog's own tuple, so it is shared, not copied.
+    ``timeline`` is created by the first live answer; answers replayed from
+    the log carry no time and are not in it.
+    """
+
+    __slots__ = (
+        "answer_type",
+        "options",
+        "counts",
+        "text_counts",
+        "terms",
+        "response_count",
+        "version",
+        "changed_at",
+        "timeline",
+    )
+    shared_slots = ("options",)
+
+    def __init__(self, poll: Mapping) -> None:
+        self.answer_type = poll.get("answer_type")
+        self.options: tuple[str, ...] = ()
+        self.counts = array("l")
+        self.text_counts: dict[str, int] | None = None
+        self.terms: TermIndex | None = None
+        self.response_count = 0
+        self.version = 0
+        self.changed_at = 0
+        self.timeline: SubmissionTimeline | None = None
+        if self.answer_type == "text":
+            self.text_counts = {}
+            self.terms = TermIndex()
+        else:
+            self.sync_options(poll)
+
+    def sync_options(self, poll: Mapping) -> None:
+        """Follow the poll's options if polls.yml added, removed or reordered them."""
+        options = poll.get("answers", ())
+        if options is self.options or tuple(options) == self.options:
+            return
+        previous = dict(zip(self.options, self.counts))
+        self.options = tuple(options)
+        self.counts = array("l", [previous.get(option, 0) for option in self.options])
+
+
+class Rollup(ResultEntry):
+    """Results of one poll summed over every run that started in one time bucket.
+
+    All of a run's submissions land in the bucket of the run's start, so a
+    resubmission retracts the earlier answer from the same rollup it was added
+    to. ``runs`` counts the runs with at least one answer to the poll.
+    """
+
+    __slots__ = ("runs",)
+
+    def __init__(self, poll: Mapping) -> None:
+        super().__init__(poll)
+        self.runs = 0
+
+    def merge(self, entry: ResultEntry, runs: int) -> None:
+        if self.text_counts is not None:
+            for answer, count in entry.text_counts.items():
+                self.text_counts[answer] = self.text_counts.get(answer, 0) + count
+            for term, count in entry.terms.counts.items():
+                self.terms.add(term, count, entry.terms.labels[term])
+        else:
+            positions = option_positions(self.options)
+            for option, count in zip(entry.options, entry.counts):
+                position = positions.get(option)
+                if position is not None:
+                    self.counts[position] += count
+        self.response_count += entry.response_count
+        self.version += entry.version
+        self.runs += runs
+
+
+def ensure_result_entry(
+    results: dict[int, ResultEntry], key: int, poll: Mapping, factory: type[ResultEntry] = ResultEntry
+) -> ResultEntry:
+    entry = results.get(key)
+    if entry is None:
+        entry = results[key] = factory(poll)
+    elif entry.text_counts is None:
+        entry.sync_options(poll)
+    return entry
+
+
+def load_result_entry(state: dict, poll: Mapping, factory: type[ResultEntry] = ResultEntry) -> ResultEntry:
+    """Build an entry from its snapshot form (see ``export_run``)."""
+    entry = factory(poll)
+    if entry.text_counts is not None:
+        language = poll_language(poll)
+        for answer, occurrences in state.get("text_counts", {}).items():
+            entry.text_counts[answer] = occurrences
+            add_answer_terms(entry.terms, answer, language, occurrences)
+    else:
+        counts = state.get("counts", {})
+        entry.counts = array("l", [counts.get(option, 0) for option in entry.options])
+    entry.response_count = state.get("response_count", 0)
+    entry.version = state.get("version", 0)
+    entry.changed_at = state.get("changed_at", 0)
+    return entry
+
+
+def snapshot_result_entry(entry: ResultEntry) -> dict:
+    # Copies only what the payload builders read, so they can run without the lock.
+    return {
+        "answer_type": entry.answer_type,
+        "counts": entry.counts.tolist(),
+        "terms": entry.terms.most_common(TEXT_CLOUD_TERMS) if entry.terms is not None else [],
+        "response_count": entry.response_count,
+        "version": entry.version,
+        "timeline": entry.timeline.copy() if entry.timeline is not None else None,
+    }
+
+
+def snapshot_requested_entries(run: RunState | None, requests: list[tuple[Mapping, int | None]]) -> list[dict | None]:
+    # Callers hold the shard's results lock; see ``ResultStore.read_entries``.
+    results = run.results if run is not None else {}
+    entries = []
+    for poll, known_version in requests:
+        poll_number = POLL_NUMBERS.get(poll_path(poll), -1)
+        if poll_number in results:
+            entry = ensure_result_entry(results, poll_number, poll)
+        else:
+            entry = ResultEntry(poll)
+        entries.append(None if entry.version == known_version else snapshot_result_entry(entry))
+    return entries
+
+
+def apply_submission(
+    entry: ResultEntry,
+    poll: Mapping,
+    submitted_answer: str | list[str],
+    previous_answer: str | list[str] | None = None,
+) -> bool:
+    answer_type = poll.get("answer_type")
+    counts = entry.counts
+    if answer_type == "single_choice":
+        if not isinstance(submitted_answer, str):
+            return False
+        positions = option_positions(entry.options)
+        previous_position = positions.get(previous_answer) if isinstance(previous_answer, str) else None
+        if previous_position is not None and counts[previous_position] > 0:
+            counts[previous_position] -= 1
+        position = positions.get(submitted_answer)
+        if position is not None:
+            counts[position] += 1
+    elif answer_type == "multiple_choice":
+        positions = option_positions(entry.options)
+        previous_choices = previous_answer if isinstance(previous_answer, list) else []
+        current_choices = submitted_answer if isinstance(submitted_answer, list) else []
+        previous_positions = {positions[choice] for choice in previous_choices if choice in positions}
+        current_positions = {positions[choice] for choice in current_choices if choice in positions}
+        had_choices = bool(previous_choices)
+        has_choices = bool(current_choices)
+
+        if not had_choices and has_choices:
+            entry.response_count += 1
+        elif had_choices and not has_choices and entry.response_count > 0:
+            entry.response_count -= 1
+
+        # Only options whose membership changed are touched.
+        for position in previous_positions - current_positions:
+            if counts[position] > 0:
+                counts[position] -= 1
+        for position in current_positions - previous_positions:
+            counts[position] += 1
+    elif answer_type == "text":
+        if not isinstance(submitted_answer, str):
+            return False
+        language = poll_language(poll)
+        text_counts = entry.text_counts
+        if (
+            isinstance(previous_answer, str)
+            and previous_answer in text_counts
+            and text_counts[previous_answer] > 0
+        ):
+            text_counts[previous_answer] -= 1
+            if text_counts[previous_answer] == 0:
+                text_counts.pop(previous_answer, None)
+            discard_answer_terms(entry.terms, previous_answer, language)
+            entry.response_count -= 1
+        text_counts[submitted_answer] = text_counts.get(submitted_answer, 0) + 1
+        add_answer_terms(entry.terms, submitted_answer, language)
+        entry.response_count += 1
+    else:
+        return False
+    return True
+
+
+def encode_answer(poll: Mapping, answer: str | list[str]) -> int | str:
+    """Pack a choice answer into a bitmask over the poll's options; text stays a string."""
+    if poll.get("answer_type") == "text":
+        return answer
+    positions = option_positions(tuple(poll.get("answers", ())))
+    chosen = {answer} if isinstance(answer, str) else set(answer)
+    return sum(1 << positions[option] for option in chosen if option in positions)
+
+
+def decode_answer(poll: Mapping, value: int | str | None) -> str | list[str] | None:
+    if value is None or isinstance(value, str):
+        return value
+    chosen = [option for position, option in enumerate(poll.get("answers", [])) if value >> position & 1]
+    if poll.get("answer_type") == "multiple_choice":
+        return chosen
+    return chosen[0] if chosen else None
+
+
+def export_entry(entry: ResultEntry) -> dict:
+    # Keyed by option label: option positions are not stable across restarts.
+    return {
+        "answer_type": entry.answer_type,
+        "counts": dict(zip(entry.options, entry.counts)),
+        "text_counts": dict(entry.text_counts or {}),
+        "response_count": entry.response_count,
+        "version": entry.version,
+        "changed_at": entry.changed_at,
+    }
+
+
+def export_results(run: RunState) -> dict[str, dict]:
+    # Keyed by "subject/topic/poll": poll numbers are not stable across restarts.
+    return {"/".join(POLL_PATHS[poll_number]): export_entry(entry) for poll_number, entry in run.results.items()}
+
+
+def add_to_rollup(
+    shard: ResultShard,
+    bucket: int,
+    poll_number: int,
+    poll: Mapping,
+    entry: ResultEntry,
+    submitted_answer: str | list[str],
+    previous_answer: str | list[str] | None,
+) -> None:
+    """Apply a submission that was just applied to ``entry`` to the rollups as well."""
+    buckets = shard.rollups.setdefault(poll_number, {})
+    rollup = ensure_result_entry(buckets, bucket, poll, Rollup)
+    if apply_submission(rollup, poll, submitted_answer, previous_answer):
+        rollup.version += 1
+    if entry.version == 1:
+        rollup.runs += 1
+
+
+def export_run(run: RunState) -> dict:
+    """Plain-JSON form of a run, used in snapshots and for archived runs."""
+    return {
+        "created": run.created,
+        "last_active": run.last_active,
+        "version": run.version,
+        "results": export_results(run),
+        "selections": {
+            topic_key: (poll_id, run.active_versions.get(topic_key, 0))
+            for topic_key, poll_id in run.active_polls.items()
+        },
+        "ledger": {
+            student: {"/".join(POLL_PATHS[poll_number]): value for poll_number, value in answers.items()}
+            for student, answers in run.ledger.items()
+        },
+    }
+
+
+def parse_poll_reference(reference: str) -> tuple[str, str, str]:
+    # Older snapshots prefixed result keys with "<run_id>|".
+    subject_id, topic_id, poll_id = reference.rpartition("|")[2].split("/", 2)
+    return subject_id, topic_id, poll_id
+
+
+def import_run(state: dict, polls_by_path: Mapping[tuple[str, str, str], Mapping]) -> RunState:
+    run = RunState(state.get("created"), state.get("last_active"))
+    run.version = state.get("version", 0)
+    for reference, entry_state in state["results"].items():
+        path = parse_poll_reference(reference)
+        poll = polls_by_path.get(path)
+        if poll is not None:
+            run.results[intern_poll(path)] = load_result_entry(entry_state, poll)
+    for topic_key, (poll_id, version) in state["selections"].items():
+        run.active_polls[topic_key] = poll_id
+        run.active_versions[topic_key] = version
+    for student, answers in state.get("ledger", {}).items():
+        run.ledger[student] = {
+            intern_poll(parse_poll_reference(reference)): value for reference, value in answers.items()
+        }
+    return run
+
+
+def estimate_size(value, seen: set[int] | None = None) -> int:
+    """Approximate deep size in bytes of the containers and slotted objects in ``value``."""
+    seen = set() if seen is None else seen
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(estimate_size(key, seen) + estimate_size(item, seen) for key, item in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(estimate_size(item, seen) for item in value)
+    elif hasattr(value, "__slots__"):
+        shared = getattr(value, "shared_slots", ())
+        size += sum(
+            estimate_size(getattr(value, name), seen)
+            for name in value.__slots__
+            if name not in shared and hasattr(value, name)
+        )
+    return size
+
+
+class ResultStore:
+    """Process-local results store: run-sharded entries and topic selections.
+
+    Every state change is also appended to ``storage`` so it can be replayed
+    after a restart. The public methods are the whole store interface; in
+    multi-worker mode the same object is served to the workers over a socket
+    (see ``SharedResultStore``).
+
+    Runs are created by writes only (a submission, a selection or a ledger
+    update); reads of unknown runs or polls answer with empty results without
+    allocating anything. Runs idle for longer than ``idle_seconds`` are evicted
+    and handed to ``storage`` for archival; using such a run again loads it back.
+    The same sweep drops the timelines of polls that went quiet (see
+    ``drop_quiet_timelines``). ``polls`` returns the current catalog's polls by path, for runs read back
+    from storage.
+    """
+
+    shared = False
+
+    def __init__(
+        self,
+        shard_count: int,
+        storage: ResultsStorage,
+        polls: Callable[[], Mapping[tuple[str, str, str], Mapping]],
+        idle_seconds: float = 0.0,
+        snapshot_seconds: float = 300.0,
+        rollup_bucket_seconds: int = 24 * 60 * 60,
+        timeline_seconds: int = 120,
+        make_lock: Callable[[str], Lock] = lambda name: Lock(),
+    ) -> None:
+        self.shards = tuple(ResultShard(make_lock) for _ in range(shard_count))
+        self.storage = storage
+        self.polls = polls
+        self.idle_seconds = idle_seconds
+        self.snapshot_seconds = snapshot_seconds
+        self.rollup_bucket_seconds = rollup_bucket_seconds
+        self.timeline_seconds = timeline_seconds
+        # Shard count of the snapshots restored from storage (0: none yet).
+        self.snapshot_shard_count = 0
+
+    def shard(self, run_id: str) -> ResultShard:
+        return self.shards[shard_index(run_id, len(self.shards))]
+
+    def _run(self, shard: ResultShard, run_id: str, create: bool) -> RunState | None:
+        # Callers hold one of the shard's field locks; runs_lock comes after it.
+        run = shard.runs.get(run_id)
+        if run is not None:
+            return run
+        with shard.runs_lock:
+            run = shard.runs.get(run_id)
+            if run is None:
+                state = self.storage.load_archived_run(run_id)
+                if state is not None:
+                    run = import_run(state, self.polls())
+                elif create:
+                    run = RunState()
+                else:
+                    return None
+                shard.runs[run_id] = run
+        return run
+
+    def get_selection(self, run_id: str, topic_key: str) -> tuple[str | None, int]:
+        shard = self.shard(run_id)
+        with shard.selection_lock:
+            run = self._run(shard, run_id, create=False)
+            if run is None:
+                return None, 0
+            run.touch()
+            return run.active_polls.get(topic_key), run.active_versions.get(topic_key, 0)
+
+    def set_selection(self, run_id: str, subject_id: str, topic_id: str, poll_id: str) -> bool:
+        """Make ``poll_id`` the active poll; return whether the selection changed."""
+        topic_key = build_topic_key(run_id, subject_id, topic_id)
+        shard = self.shard(run_id)
+        with shard.selection_lock:
+            run = self._run(shard, run_id, create=True)
+            run.touch()
+            if run.active_polls.get(topic_key) == poll_id:
+                return False
+            run.active_polls[topic_key] = poll_id
+            run.active_versions[topic_key] = run.active_versions.get(topic_key, 0) + 1
+            if self.storage.persistent:
+                self.storage.append(
+                    self.storage.next_sequence(),
+                    {"type": "selection", "run": run_id, "subject": subject_id, "topic": topic_id, "poll": poll_id},
+                )
+        return True
+
+    def record(
+        self,
+        run_id: str,
+        poll: Mapping,
+        submitted_answer: str | list[str],
+        previous_answer: str | list[str] | None = None,
+        student: str | None = None,
+    ) -> bool:
+        return self.record_batch([(run_id, poll, submitted_answer, previous_answer, student)])[0]
+
+    def record_batch(self, submissions: list[tuple]) -> list[bool]:
+        """Apply ``(run_id, poll, answer, previous_answer, student)`` tuples.
+
+        A submission with a ``student`` replaces that student's answer in the
+        ledger, and the answer it replaces is looked up there while the
+        submission is applied, so two quick resubmissions cannot both count
+        against the same earlier answer. ``previous_answer`` is used only when
+        the ledger has none: without a student, or for an answer given before
+        the ledger existed. The ledger is persisted through the ``student``
+        field of the logged event; see ``restore``.
+
+        Each shard lock is taken once per batch and the shard's log events are
+        handed to the storage writer in one call. Events are appended while the
+        lock is still held, which keeps them ordered before any snapshot taken
+        afterwards (see ``compact``).
+        """
+        by_shard: dict[int, list[int]] = {}
+        for index, (run_id, *_) in enumerate(submissions):
+            by_shard.setdefault(shard_index(run_id, len(self.shards)), []).append(index)
+
+        applied = [False] * len(submissions)
+        now = int(time())
+        for position, indexes in by_shard.items():
+            shard = self.shards[position]
+            events = []
+            with shard.results_lock, shard.ledger_lock:
+                for index in indexes:
+                    run_id, poll, submitted_answer, previous_answer, student = submissions[index]
+                    run = self._run(shard, run_id, create=True)
+                    run.touch()
+                    poll_number = intern_poll(poll_path(poll))
+                    answers = run.ledger.setdefault(student, {}) if student else None
+                    if answers and poll_number in answers:
+                        previous_answer = decode_answer(poll, answers[poll_number])
+                    entry = ensure_result_entry(run.results, poll_number, poll)
+                    if not apply_submission(entry, poll, submitted_answer, previous_answer):
+                        continue
+                    if answers is not None:
+                        answers[poll_number] = encode_answer(poll, submitted_answer)
+                    entry.version += 1
+                    run.version += 1
+                    entry.changed_at = run.version
+                    if entry.timeline is None:
+                        entry.timeline = SubmissionTimeline(self.timeline_seconds, now)
+                    entry.timeline.record(now, changed=bool(previous_answer))
+                    add_to_rollup(
+                        shard, self.rollup_bucket(run.created), poll_number, poll, entry, submitted_answer, previous_answer
+                    )
+                    applied[index] = True
+                    if self.storage.persistent:
+                        events.append(
+                            (
+                                self.storage.next_sequence(),
+                                {
+                                    "type": "submission",
+                                    "run": run_id,
+                                    "subject": poll.get("subject"),
+                                    "topic": poll.get("topic"),
+                                    "poll": poll.get("id"),
+                                    "answer": submitted_answer,
+                                    "previous": previous_answer,
+                                    "student": student,
+                                },
+                            )
+                        )
+                if events:
+                    self.storage.append_many(events)
+        return applied
+
+    def read_entries(self, run_id: str, requests: list[tuple[Mapping, int | None]]) -> list[dict | None]:
+        """Snapshot entries for ``(poll, known_version)`` requests.
+
+        Returns ``None`` in place of entries still at ``known_version``, so
+        callers holding a rendered payload for that version skip the copy.
+        Polls nobody has answered yet get an empty entry that is not stored.
+        """
+        shard = self.shard(run_id)
+        with shard.results_lock:
+            run = self._run(shard, run_id, create=False)
+            if run is not None:
+                run.touch()
+            return snapshot_requested_entries(run, requests)
+
+    def read_topic(
+        self, run_id: str, topic_key: str, requests: list[tuple[Mapping, int | None]], since: int
+    ) -> dict:
+        """Everything a topic results request reads, in one call.
+
+        Returns the topic's ``selection``, the ``run_version``, the ``versions``
+        of the requested polls, the polls ``changed`` after ``since`` and their
+        ``entries`` as ``read_entries`` returns them. When ``since`` is negative
+        or ahead of the run, ``entries`` covers every requested poll instead.
+        """
+        selection = self.get_selection(run_id, topic_key)
+        shard = self.shard(run_id)
+        with shard.results_lock:
+            run = self._run(shard, run_id, create=False)
+            results = run.results if run is not None else {}
+            run_version = run.version if run is not None else 0
+            versions = []
+            changed = []
+            for poll, _ in requests:
+                path = poll_path(poll)
+                entry = results.get(POLL_NUMBERS.get(path, -1))
+                versions.append(entry.version if entry is not None else 0)
+                if entry is not None and entry.changed_at > max(since, 0):
+                    changed.append(path)
+            if not 0 <= since <= run_version:
+                wanted = requests
+            else:
+                changed_paths = set(changed)
+                wanted = [request for request in requests if poll_path(request[0]) in changed_paths]
+            entries = snapshot_requested_entries(run, wanted)
+        return {
+            "selection": selection,
+            "run_version": run_version,
+            "versions": versions,
+            "changed": changed,
+            "entries": entries,
+        }
+
+    def read_student(
+        self, run_id: str, topic_key: str, student: str | None, paths: list[tuple[str, str, str]]
+    ) -> tuple[str | None, int, list[int | str | None]]:
+        """A topic's selection and ``student``'s encoded answers to ``paths``, in one call."""
+        poll_id, version = self.get_selection(run_id, topic_key)
+        if student is None:
+            return poll_id, version, [None] * len(paths)
+        shard = self.shard(run_id)
+        with shard.ledger_lock:
+            run = self._run(shard, run_id, create=False)
+            answers = run.ledger.get(student, {}) if run is not None else {}
+            return poll_id, version, [answers.get(POLL_NUMBERS.get(path, -1)) for path in paths]
+
+    def run_count(self) -> int:
+        return sum(len(shard.runs) for shard in self.shards)
+
+    def versions(self, run_id: str, paths: list[tuple[str, str, str]]) -> list[int]:
+        shard = self.shard(run_id)
+        with shard.results_lock:
+            run = self._run(shard, run_id, create=False)
+            if run is None:
+                return [0] * len(paths)
+            versions = []
+            for path in paths:
+                entry = run.results.get(POLL_NUMBERS.get(path, -1))
+                versions.append(entry.version if entry is not None else 0)
+            return versions
+
+    def changes(self, run_id: str, paths: list[tuple[str, str, str]], since: int) -> tuple[int, list[tuple[str, str, str]]]:
+        """Return the run's version and those of ``paths`` whose results changed after version ``since``."""
+        shard = self.shard(run_id)
+        with shard.results_lock:
+            run = self._run(shard, run_id, create=False)
+            if run is None:
+                return 0, []
+            changed = []
+            for path in paths:
+                entry = run.results.get(POLL_NUMBERS.get(path, -1))
+                if entry is not None and entry.changed_at > since:
+                    changed.append(path)
+            return run.version, changed
+
+    def touched(self, run_id: str, since: int | None = None) -> tuple[int, list[tuple[str, str, str]]]:
+        """Return the run's version and the paths of its answered polls, or of those changed after ``since``.
+
+        Only the run's own entries are visited, never the whole catalog.
+        """
+        shard = self.shard(run_id)
+        with shard.results_lock:
+            run = self._run(shard, run_id, create=False)
+            if run is None:
+                return 0, []
+            touched = [
+                POLL_PATHS[poll_number]
+                for poll_number, entry in run.results.items()
+                if (entry.version > 0 if since is None else entry.changed_at > since)
+            ]
+            return run.version, touched
+
+    def run_stats(self, run_id: str | None = None) -> list[dict]:
+        """Age and approximate memory of one run, or of every run in memory."""
+        stats = []
+        for shard in self.shards if run_id is None else (self.shard(run_id),):
+            # Runs are only added under one of these locks, so the dict is stable here.
+            with shard.results_lock, shard.selection_lock, shard.ledger_lock:
+                for key, run in shard.runs.items():
+                    if run_id is not None and key != run_id:
+                        continue
+                    stats.append(
+                        {
+                            "run": key,
+                            "created": run.created,
+                            "last_active": run.last_active,
+                            "polls": len(run.results),
+                            "students": len(run.ledger),
+                            "bytes": estimate_size(run),
+                        }
+                    )
+        return stats
+
+    def run_ids(self, since: float | None = None, until: float | None = None) -> list[str]:
+        """Ids of runs created in ``[since, until)``, in memory or archived, oldest first."""
+        created: dict[str, float] = {}
+        for shard in self.shards:
+            with shard.runs_lock:
+                for run_id, run in shard.runs.items():
+                    if (since is None or run.created >= since) and (until is None or run.created < until):
+                        created[run_id] = run.created
+        for run_id, run_created in self.storage.archived_run_ids(since, until):
+            created.setdefault(run_id, run_created)
+        return sorted(created, key=created.__getitem__)
+
+    def export_runs(self, run_ids: list[str]) -> list[tuple[str, dict]]:
+        """Copy the results of each run for an export.
+
+        One run's results lock is held at a time, only while copying that run,
+        so live submissions to other runs never wait on an export. Archived runs
+        are read from storage without loading them back into memory.
+        """
+        exported = []
+        for run_id in run_ids:
+            shard = self.shard(run_id)
+            with shard.results_lock:
+                run = shard.runs.get(run_id)
+                state = {"created": run.created, "results": export_results(run)} if run is not None else None
+            if state is None:
+                state = self.storage.load_archived_run(run_id)
+            if state is not None:
+                exported.append((run_id, {"created": state["created"], "results": state["results"]}))
+        return exported
+
+    def evict_idle(self, now: float | None = None) -> int:
+        """Drop runs idle for longer than ``idle_seconds``, archiving them first.
+
+        The archives are stored together with a new snapshot of their shard, so
+        ``restore`` does not replay the logged events they already contain.
+        """
+        deadline = (now or time()) - self.idle_seconds
+        evicted = 0
+        for index, shard in enumerate(self.shards):
+            # Holding every lock of the shard means no event for these runs is in flight.
+            locks = shard.all_locks()
+            for lock in locks:
+                lock.acquire()
+            try:
+                idle = [run_id for run_id, run in shard.runs.items() if run.last_active < deadline]
+                archived = [(run_id, export_run(shard.runs.pop(run_id))) for run_id in idle]
+                if archived and self.storage.persistent:
+                    through_sequence, state = self._copy_shard(shard)
+                    self.storage.write_snapshot(len(self.shards), [(index, through_sequence, state)], archived)
+                evicted += len(archived)
+            finally:
+                for lock in reversed(locks):
+                    lock.release()
+        return evicted
+
+    def drop_quiet_timelines(self, now: float | None = None) -> int:
+        """Free the timelines of polls with no answer for a whole window.
+
+        A poll that went quiet would otherwise keep its rings for as long as its
+        run stays resident; its next answer starts a new timeline.
+        """
+        deadline = int(now or time()) - self.timeline_seconds
+        dropped = 0
+        for shard in self.shards:
+            with shard.results_lock:
+                for run in shard.runs.values():
+                    for entry in run.results.values():
+                        if entry.timeline is not None and entry.timeline.last < deadline:
+                            entry.timeline = None
+                            dropped += 1
+        return dropped
+
+    def restore(self, polls_by_path: Mapping[tuple[str, str, str], Mapping]) -> None:
+        """Rebuild runs from the latest shard snapshots plus the event log.
+
+        A logged event is replayed only if it came after the snapshot of the
+        shard its run was in when the snapshots were taken.
+        """
+        self.storage.open()
+        self.snapshot_shard_count, snapshots, events = self.storage.load()
+        same_layout = self.snapshot_shard_count == len(self.shards)
+        rebuild_rollups = not same_layout
+        last_sequence = 0
+        for index, (through_sequence, state) in snapshots.items():
+            last_sequence = max(last_sequence, through_sequence)
+            self._restore_snapshot(state, polls_by_path)
+            if same_layout and "rollups" in state:
+                self.load_rollups(state["rollups"], polls_by_path, self.shards[index])
+            else:
+                rebuild_rollups = True
+        if snapshots and rebuild_rollups:
+            # A resubmission retracts its earlier answer from its own shard's
+            # rollups, so they are summed again from the runs in their new shards.
+            self.rebuild_rollups(polls_by_path)
+
+        for sequence, event in events:
+            last_sequence = max(last_sequence, sequence)
+            run_id, subject_id, topic_id, poll_id = event["run"], event["subject"], event["topic"], event["poll"]
+            covered = snapshots.get(shard_index(run_id, self.snapshot_shard_count)) if snapshots else None
+            if covered is not None and sequence <= covered[0]:
+                continue
+            # A run archived before the snapshot is loaded back before replaying onto it.
+            run = self._run(self.shard(run_id), run_id, create=True)
+            if event["type"] == "selection":
+                topic_key = build_topic_key(run_id, subject_id, topic_id)
+                run.active_polls[topic_key] = poll_id
+                run.active_versions[topic_key] = run.active_versions.get(topic_key, 0) + 1
+                continue
+            poll = polls_by_path.get((subject_id, topic_id, poll_id))
+            if poll is None:
+                # The poll was removed from polls.yml since the answer was logged.
+                continue
+            poll_number = intern_poll((subject_id, topic_id, poll_id))
+            entry = ensure_result_entry(run.results, poll_number, poll)
+            if apply_submission(entry, poll, event["answer"], event["previous"]):
+                entry.version += 1
+                run.version += 1
+                entry.changed_at = run.version
+                add_to_rollup(
+                    self.shard(run_id),
+                    self.rollup_bucket(run.created),
+                    poll_number,
+                    poll,
+                    entry,
+                    event["answer"],
+                    event["previous"],
+                )
+            if event.get("student"):
+                run.ledger.setdefault(event["student"], {})[poll_number] = encode_answer(poll, event["answer"])
+
+        self.storage.resume_sequence(last_sequence)
+
+    def _restore_snapshot(self, state: dict, polls_by_path: Mapping[tuple[str, str, str], Mapping]) -> None:
+        if "runs" in state:
+            for run_id, run_state in state["runs"].items():
+                self.shard(run_id).runs[run_id] = import_run(run_state, polls_by_path)
+        else:
+            # Snapshots written before runs were tracked as objects.
+            for run_id, students in state.get("ledgers", {}).items():
+                run = self._run(self.shard(run_id), run_id, create=True)
+                for student, answers in students.items():
+                    run.ledger[student] = {
+                        intern_poll(parse_poll_reference(reference)): value for reference, value in answers.items()
+                    }
+            for submission_key, entry_state in state["results"].items():
+                run_id = run_id_from_key(submission_key)
+                path = parse_poll_reference(submission_key)
+                if path in polls_by_path:
+                    run = self._run(self.shard(run_id), run_id, create=True)
+                    run.results[intern_poll(path)] = load_result_entry(entry_state, polls_by_path[path])
+            for topic_key, (poll_id, version) in state["selections"].items():
+                run_id = run_id_from_key(topic_key)
+                run = self._run(self.shard(run_id), run_id, create=True)
+                run.active_polls[topic_key] = poll_id
+                run.active_versions[topic_key] = version
+
+    def compact(self) -> None:
+        """Snapshot the runs shard by shard and drop the log events every snapshot covers.
+
+        Only one shard's locks are held at a time. Events draw their sequence
+        number under their run's shard locks, so each shard's snapshot contains
+        exactly that shard's events up to the ``through`` sequence drawn while
+        it was copied.
+        """
+        snapshots = []
+        for index, shard in enumerate(self.shards):
+            locks = shard.all_locks()
+            for lock in locks:
+                lock.acquire()
+            try:
+                snapshots.append((index, *self._copy_shard(shard)))
+            finally:
+                for lock in reversed(locks):
+                    lock.release()
+        self.storage.write_snapshot(len(self.shards), snapshots)
+        self.snapshot_shard_count = len(self.shards)
+
+    def _copy_shard(self, shard: ResultShard) -> tuple[int, dict]:
+        """Return ``(through sequence, state)`` for a shard whose locks the caller holds."""
+        through_sequence = self.storage.next_sequence()
+        runs = {run_id: export_run(run) for run_id, run in shard.runs.items()}
+        rollups = {
+            "/".join(POLL_PATHS[poll_number]): {
+                str(bucket): {**export_entry(rollup), "runs": rollup.runs} for bucket, rollup in buckets.items()
+            }
+            for poll_number, buckets in shard.rollups.items()
+        }
+        return through_sequence, {"runs": runs, "rollups": rollups}
+
+    def load_rollups(
+        self, rollups: dict, polls_by_path: Mapping[tuple[str, str, str], Mapping], shard: ResultShard
+    ) -> None:
+        for reference, buckets in rollups.items():
+            path = parse_poll_reference(reference)
+            poll = polls_by_path.get(path)
+            if poll is None:
+                continue
+            poll_number = intern_poll(path)
+            for bucket, state in buckets.items():
+                rollup = load_result_entry(state, poll, Rollup)
+                rollup.runs = state.get("runs", 0)
+                shard.rollups.setdefault(poll_number, {})[int(bucket)] = rollup
+
+    def rebuild_rollups(self, polls_by_path: Mapping[tuple[str, str, str], Mapping]) -> None:
+        """Sum every run in memory and in the archive into fresh rollups."""
+        in_memory = set()
+        for shard in self.shards:
+            shard.rollups.clear()
+            for run_id, run in shard.runs.items():
+                in_memory.add(run_id)
+                self._merge_into_rollups(shard, run.created, run.results.items())
+        for run_id, _ in self.storage.archived_run_ids():
+            state = self.storage.load_archived_run(run_id) if run_id not in in_memory else None
+            if state is None:
+                continue
+            entries = []
+            for reference, entry_state in state["results"].items():
+                path = parse_poll_reference(reference)
+                if path in polls_by_path:
+                    entries.append((intern_poll(path), load_result_entry(entry_state, polls_by_path[path])))
+            self._merge_into_rollups(self.shard(run_id), state["created"], entries)
+
+    def _merge_into_rollups(self, shard: ResultShard, created: float, entries: Iterable[tuple[int, ResultEntry]]) -> None:
+        polls_by_path = self.polls()
+        for poll_number, entry in entries:
+            poll = polls_by_path.get(POLL_PATHS[poll_number])
+            if poll is None or not entry.version:
+                continue
+            buckets = shard.rollups.setdefault(poll_number, {})
+            ensure_result_entry(buckets, self.rollup_bucket(created), poll, Rollup).merge(entry, 1)
+
+    def rollup_bucket(self, timestamp: float) -> int:
+        return int(timestamp // self.rollup_bucket_seconds * self.rollup_bucket_seconds)
+
+    def rollups(
+        self, poll: Mapping, since: float | None = None, until: float | None = None, per_bucket: bool = False
+    ) -> dict:
+        """Results of ``poll`` summed over the runs of buckets starting in ``[since, until)``.
+
+        Returns ``{"total": entry, "buckets": [(bucket start, entry), ...]}`` with
+        entries in ``snapshot_result_entry`` form plus ``runs``; the bucket list
+        is only filled when ``per_bucket`` is set. Each shard's share is summed
+        under that shard's results lock alone, without looking at any run.
+        """
+        poll_number = intern_poll(poll_path(poll))
+        merged: dict[int, Rollup] = {}
+        for shard in self.shards:
+            with shard.results_lock:
+                for bucket, rollup in shard.rollups.get(poll_number, {}).items():
+                    if (since is None or bucket >= since) and (until is None or bucket < until):
+                        ensure_result_entry(merged, bucket, poll, Rollup).merge(rollup, rollup.runs)
+        total = Rollup(poll)
+        for rollup in merged.values():
+            total.merge(rollup, rollup.runs)
+        return {
+            "total": {**snapshot_result_entry(total), "runs": total.runs},
+            "buckets": [
+                (bucket, {**snapshot_result_entry(rollup), "runs": rollup.runs})
+                for bucket, rollup in sorted(merged.items())
+            ]
+            if per_bucket
+            else [],
+        }
+
+    def start(self, polls_by_path: Mapping[tuple[str, str, str], Mapping]) -> None:
+        """Restore persisted runs and start the compaction and eviction threads."""
+        if self.storage.persistent:
+            self.restore(polls_by_path)
+            if self.snapshot_shard_count != len(self.shards):
+                # Replace snapshots taken with another shard count, or from before shards were snapshotted.
+                self.compact()
+            Thread(target=self._run_compactor, name="results-compactor", daemon=True).start()
+        Thread(target=self._run_evictor, name="run-evictor", daemon=True).start()
+
+    def close(self) -> None:
+        if self.storage.events_since_snapshot:
+            self.compact()
+        self.storage.close()
+
+    def _run_compactor(self) -> None:
+        while True:
+            sleep(self.snapshot_seconds)
+            if self.storage.events_since_snapshot:
+                self.compact()
+
+    def _run_evictor(self) -> None:
+        while True:
+            sleep(RUN_EVICTION_INTERVAL_SECONDS)
+            self.drop_quiet_timelines()
+            if self.idle_seconds:
+                self.evict_idle()
+
+
+def thaw(value):
+    if isinstance(value, Mapping):
+        return {key: thaw(item) for key, item in value.items()}
+    return value
+
+
+class SharedResultStore:
+    """Client for a ``ResultStore`` served by ``flask serve-state``.
+
+    Used when SHARED_STATE_ADDRESS is set, so every worker process reads and
+    writes the same results. Calls go over a local socket; polls are passed as
+    plain dicts because catalog snapshots are not picklable.
+    """
+
+    shared = True
+
+    def __init__(self, address: str, authkey: bytes, connect_timeout: float = 30.0) -> None:
+        manager = BaseManager(address=address, authkey=authkey)
+        manager.register("results")
+        deadline = monotonic() + connect_timeout
+        while True:
+            try:
+                manager.connect()
+                break
+            except (FileNotFoundError, ConnectionRefusedError):
+                if monotonic() > deadline:
+                    raise
+                sleep(0.1)
+        self._store = manager.results()
+
+    def close(self) -> None:
+        """Nothing to do: the state server persists and closes the store."""
+
+    def get_selection(self, run_id: str, topic_key: str) -> tuple[str | None, int]:
+        return self._store.get_selection(run_id, topic_key)
+
+    def set_selection(self, run_id: str, subject_id: str, topic_id: str, poll_id: str) -> bool:
+        return self._store.set_selection(run_id, subject_id, topic_id, poll_id)
+
+    def record(
+        self,
+        run_id: str,
+        poll: Mapping,
+        submitted_answer: str | list[str],
+        previous_answer: str | list[str] | None = None,
+        student: str | None = None,
+    ) -> bool:
+        return self._store.record(run_id, thaw(poll), submitted_answer, previous_answer, student)
+
+    def record_batch(self, submissions: list[tuple]) -> list[bool]:
+        # One round trip per batch instead of one per submission.
+        submissions = [(run_id, thaw(poll), *rest) for run_id, poll, *rest in submissions]
+        return self._store.record_batch(submissions)
+
+    def read_entries(self, run_id: str, requests: list[tuple[Mapping, int | None]]) -> list[dict | None]:
+        requests = [(thaw(poll), known_version) for poll, known_version in requests]
+        return self._store.read_entries(run_id, requests)
+
+    def read_topic(
+        self, run_id: str, topic_key: str, requests: list[tuple[Mapping, int | None]], since: int
+    ) -> dict:
+        requests = [(thaw(poll), known_version) for poll, known_version in requests]
+        return self._store.read_topic(run_id, topic_key, requests, since)
+
+    def read_student(
+        self, run_id: str, topic_key: str, student: str | None, paths: list[tuple[str, str, str]]
+    ) -> tuple[str | None, int, list[int | str | None]]:
+        return self._store.read_student(run_id, topic_key, student, paths)
+
+    def versions(self, run_id: str, paths: list[tuple[str, str, str]]) -> list[int]:
+        return self._store.versions(run_id, paths)
+
+    def changes(self, run_id: str, paths: list[tuple[str, str, str]], since: int) -> tuple[int, list[tuple[str, str, str]]]:
+        return self._store.changes(run_id, paths, since)
+
+    def touched(self, run_id: str, since: int | None = None) -> tuple[int, list[tuple[str, str, str]]]:
+        return self._store.touched(run_id, since)
+
+    def run_stats(self, run_id: str | None = None) -> list[dict]:
+        return self._store.run_stats(run_id)
+
+    def run_count(self) -> int:
+        return self._store.run_count()
+
+    def run_ids(self, since: float | None = None, until: float | None = None) -> list[str]:
+        return self._store.run_ids(since, until)
+
+    def rollups(
+        self, poll: Mapping, since: float | None = None, until: float | None = None, per_bucket: bool = False
+    ) -> dict:
+        return self._store.rollups(thaw(poll), since, until, per_bucket)
+
+    def export_runs(self, run_ids: list[str]) -> list[tuple[str, dict]]:
+        return self._store.export_runs(run_ids)
+
+    def start(self, polls_by_path: Mapping[tuple[str, str, str], Mapping]) -> None:
+        # The state server owns persistence and eviction.
+        pass
+
+
+def run_id_from_key(key: str) -> str:
+    # Submission and topic keys both start with "<run_id>|".
+    return key.partition("|")[0]
+
+
+def percentile(sorted_values: list[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+class SubmissionIngestor:
+    """Decouples student submissions from the results store.
+
+    Request handlers only enqueue an already validated submission. One
+    aggregator thread drains whatever has queued up, applies it with a single
+    ``apply`` call (a store's ``record_batch``: one lock acquisition per shard,
+    one storage write) and then calls ``publish`` with the topic key of every
+    topic that changed, to wake its event streams. When the whole room answers
+    at once, handlers no longer queue up behind the results locks.
+    """
+
+    def __init__(
+        self,
+        apply: Callable[[list[tuple]], list[bool]],
+        publish: Callable[[str], None],
+        max_batch: int = 1_000,
+        latency_window: int = 2_048,
+    ) -> None:
+        self.apply = apply
+        self.publish = publish
+        self.max_batch = max_batch
+        self._queue: SimpleQueue = SimpleQueue()
+        self._start_lock = Lock()
+        self._thread: Thread | None = None
+        self._stats_lock = Lock()
+        self.submissions = 0
+        self.batches = 0
+        self.largest_batch = 0
+        self._apply_seconds: deque[float] = deque(maxlen=latency_window)
+        self._queue_seconds: deque[float] = deque(maxlen=latency_window)
+
+    def submit(self, run_id: str, subject_id: str, topic_id: str, submission: tuple) -> None:
+        self._ensure_started()
+        self._queue.put((monotonic(), build_topic_key(run_id, subject_id, topic_id), submission))
+
+    def flush(self) -> None:
+        """Block until everything enqueued before the call has been applied."""
+        if self._thread is None:
+            return
+        done = Event()
+        self._queue.put(done)
+        done.wait()
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            apply_seconds = sorted(self._apply_seconds)
+            queue_seconds = sorted(self._queue_seconds)
+            return {
+                "queue_depth": self._queue.qsize(),
+                "submissions": self.submissions,
+                "batches": self.batches,
+                "largest_batch": self.largest_batch,
+                "apply_ms_p50": round(percentile(apply_seconds, 0.50) * 1000, 3),
+                "apply_ms_p99": round(percentile(apply_seconds, 0.99) * 1000, 3),
+                "queue_wait_ms_p50": round(percentile(queue_seconds, 0.50) * 1000, 3),
+                "queue_wait_ms_p99": round(percentile(queue_seconds, 0.99) * 1000, 3),
+            }
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = Thread(target=self._run, name="submission-ingestor", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            items = [self._queue.get()]
+            while len(items) < self.max_batch:
+                try:
+                    items.append(self._queue.get_nowait())
+                except Empty:
+                    break
+
+            waiters = [item for item in items if isinstance(item, Event)]
+            batch = [item for item in items if not isinstance(item, Event)]
+            if batch:
+                started = monotonic()
+                try:
+                    applied = self.apply([submission for _, _, submission in batch])
+                except Exception:
+                    # Keep draining: one failed batch must not stall every later submission.
+                    logger.exception("Dropped a batch of %d submissions", len(batch))
+                    applied = [False] * len(batch)
+                finished = monotonic()
+                for topic_key in {topic_key for (_, topic_key, _), ok in zip(batch, applied) if ok}:
+                    self.publish(topic_key)
+                with self._stats_lock:
+                    self.submissions += len(batch)
+                    self.batches += 1
+                    self.largest_batch = max(self.largest_batch, len(batch))
+                    self._apply_seconds.append(finished - started)
+                    self._queue_seconds.extend(finished - enqueued for enqueued, _, _ in batch)
+            for waiter in waiters:
+                waiter.set()
@@ -0,0 +1,326 @@
+"""Persistence backends for poll results.
+
+The app logs every state change (a submission or a new active poll) as an
+event with a process-wide sequence number. A backend appends those events and
+stores occasional snapshots of each shard of the state, each with the sequence
+number it covers; on startup the app restores the latest snapshots and replays
+the events logged after them. Runs evicted from memory after going idle are
+archived by the backend, along with a snapshot of their shard, and loaded back
+on demand.
+
+Backends are chosen with ``RESULTS_STORAGE``:
+
+- ``memory``: nothing is persisted.
+- ``sqlite:<path>``: SQLite in WAL mode (the default).
+"""
+
+from collections.abc import Iterable
+from itertools import count
+import json
+import logging
+from pathlib import Path
+from queue import Empty, SimpleQueue
+import sqlite3
+from threading import Event, Lock, Thread
+
+logger = logging.getLogger(__name__)
+
+
+class ResultsStorage:
+    """In-memory backend: the interface every backend implements, doing nothing."""
+
+    persistent = False
+
+    def __init__(self) -> None:
+        self._sequence = count(1)
+        self._sequence_lock = Lock()
+        self.events_since_snapshot = 0
+
+    def next_sequence(self) -> int:
+        with self._sequence_lock:
+            return next(self._sequence)
+
+    def resume_sequence(self, last_sequence: int) -> None:
+        with self._sequence_lock:
+            self._sequence = count(last_sequence + 1)
+
+    def open(self) -> None:
+        """Connect to the backing store; called once, before anything is loaded or written."""
+
+    def load(self) -> tuple[int, dict[int, tuple[int, dict]], list[tuple[int, dict]]]:
+        """Return ``(shard_count, {shard: (through_sequence, state)}, [(sequence, event), ...])``.
+
+        Events are those after the oldest shard snapshot; ``shard_count`` is 0
+        when there are no snapshots.
+        """
+        return 0, {}, []
+
+    def append(self, sequence: int, event: dict) -> None:
+        pass
+
+    def append_many(self, events: list[tuple[int, dict]]) -> None:
+        for sequence, event in events:
+            self.append(sequence, event)
+
+    def write_snapshot(
+        self, shard_count: int, snapshots: list[tuple[int, int, dict]], archived: Iterable[tuple[str, dict]] = ()
+    ) -> None:
+        """Store ``(shard, through_sequence, state)`` snapshots taken with ``shard_count`` shards.
+
+        ``archived`` lists ``(run_id, state)`` of runs evicted from those shards;
+        they are stored in the same transaction as the snapshots.
+        """
+
+    def load_archived_run(self, run_id: str) -> dict | None:
+        return None
+
+    def archived_run_ids(self, since: float | None = None, until: float | None = None) -> list[tuple[str, float]]:
+        """Return ``(run_id, created)`` for archived runs created in ``[since, until)``."""
+        return []
+
+    def flush(self) -> None:
+        """Wait until everything handed over so far is written; raise ``StorageError`` if it was not."""
+
+    def close(self) -> None:
+        pass
+
+
+class StorageError(RuntimeError):
+    """Handed-over events or snapshots could not be written."""
+
+
+class SQLiteStorage(ResultsStorage):
+    """Append-only event log plus snapshot table in a WAL-mode SQLite file.
+
+    Writes go through a queue to a single writer thread. It drains everything
+    queued since its last commit into one transaction, so a burst of
+    submissions costs one fsync instead of one per answer. A transaction that
+    fails is logged and the writer carries on: the state is still in memory,
+    so it asks for a new full snapshot and keeps the failed batch's archived
+    runs for the next one.
+    """
+
+    persistent = True
+
+    def __init__(self, path: str | Path, batch_size: int = 1_000) -> None:
+        super().__init__()
+        self.path = Path(path)
+        self.batch_size = batch_size
+        self._queue: SimpleQueue = SimpleQueue()
+        # Archived runs the writer has not committed yet, so a lookup never misses them.
+        self._pending_archives: dict[str, str] = {}
+        # Every archived run id, so looking up a run that was never archived
+        # (each new run, on its first request) does not query the database.
+        self._archived_ids: set[str] = set()
+        # Archived runs of a failed write, stored again with the next snapshot.
+        self._unwritten_archives: list[tuple[str, str]] = []
+        self._pending_lock = Lock()
+        self._writer: Thread | None = None
+
+    def open(self) -> None:
+        if self._writer is not None:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._connection = sqlite3.connect(self.path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=FULL")
+        self._connection.execute("CREATE TABLE IF NOT EXISTS events (seq INTEGER PRIMARY KEY, payload TEXT NOT NULL)")
+        # Written before shards were snapshotted one at a time; read as the only shard of one.
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS snapshot "
+            "(id INTEGER PRIMARY KEY CHECK (id = 1), through_seq INTEGER NOT NULL, payload TEXT NOT NULL)"
+        )
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS shard_snapshots (shard INTEGER PRIMARY KEY, "
+            "shard_count INTEGER NOT NULL, through_seq INTEGER NOT NULL, payload TEXT NOT NULL)"
+        )
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS archived_runs "
+            "(run_id TEXT PRIMARY KEY, archived_at REAL NOT NULL, payload TEXT NOT NULL)"
+        )
+        self._connection.commit()
+        # Archive lookups come from request threads; they get their own connection.
+        self._reader = sqlite3.connect(self.path, check_same_thread=False)
+        self._reader_lock = Lock()
+        self._archived_ids = {run_id for (run_id,) in self._connection.execute("SELECT run_id FROM archived_runs")}
+        self._writer = Thread(target=self._write_loop, name="results-storage-writer", daemon=True)
+        self._writer.start()
+
+    def load(self) -> tuple[int, dict[int, tuple[int, dict]], list[tuple[int, dict]]]:
+        rows = self._connection.execute("SELECT shard, shard_count, through_seq, payload FROM shard_snapshots").fetchall()
+        if rows:
+            shard_count = rows[0][1]
+            snapshots = {shard: (through, json.loads(payload)) for shard, _, through, payload in rows}
+        else:
+            row = self._connection.execute("SELECT through_seq, payload FROM snapshot WHERE id = 1").fetchone()
+            shard_count = 1 if row else 0
+            snapshots = {0: (row[0], json.loads(row[1]))} if row else {}
+        through_sequence = min((through for through, _ in snapshots.values()), default=0)
+        events = [
+            (sequence, json.loads(payload))
+            for sequence, payload in self._connection.execute(
+                "SELECT seq, payload FROM events WHERE seq > ? ORDER BY seq", (through_sequence,)
+            )
+        ]
+        self.events_since_snapshot = len(events)
+        return shard_count, snapshots, events
+
+    def append(self, sequence: int, event: dict) -> None:
+        self.events_since_snapshot += 1
+        self._queue.put(("event", sequence, json.dumps(event, separators=(",", ":"))))
+
+    def append_many(self, events: list[tuple[int, dict]]) -> None:
+        self.events_since_snapshot += len(events)
+        rows = [(sequence, json.dumps(event, separators=(",", ":"))) for sequence, event in events]
+        self._queue.put(("events", rows, None))
+
+    def write_snapshot(
+        self, shard_count: int, snapshots: list[tuple[int, int, dict]], archived: Iterable[tuple[str, dict]] = ()
+    ) -> None:
+        if len(snapshots) == shard_count:
+            self.events_since_snapshot = 0
+        rows = [
+            (shard, shard_count, through_sequence, json.dumps(state, separators=(",", ":")))
+            for shard, through_sequence, state in snapshots
+        ]
+        archives = [(run_id, json.dumps(state, separators=(",", ":"))) for run_id, state in archived]
+        with self._pending_lock:
+            self._pending_archives.update(archives)
+            self._archived_ids.update(run_id for run_id, _ in archives)
+            archives = self._unwritten_archives + archives
+            self._unwritten_archives = []
+        self._queue.put(("snapshot", shard_count, (rows, archives)))
+
+    def load_archived_run(self, run_id: str) -> dict | None:
+        with self._pending_lock:
+            if run_id not in self._archived_ids:
+                return None
+            payload = self._pending_archives.get(run_id)
+        if payload is None:
+            with self._reader_lock:
+                row = self._reader.execute("SELECT payload FROM archived_runs WHERE run_id = ?", (run_id,)).fetchone()
+            payload = row[0] if row else None
+        return json.loads(payload) if payload is not None else None
+
+    def archived_run_ids(self, since: float | None = None, until: float | None = None) -> list[tuple[str, float]]:
+        with self._reader_lock:
+            rows = self._reader.execute(
+                "SELECT run_id, json_extract(payload, '$.created') AS created FROM archived_runs "
+                "WHERE created >= ? AND created < ?",
+                (since if since is not None else float("-inf"), until if until is not None else float("inf")),
+            ).fetchall()
+        with self._pending_lock:
+            pending = [(run_id, json.loads(payload)["created"]) for run_id, payload in self._pending_archives.items()]
+        committed = {run_id for run_id, _ in rows}
+        rows += [
+            (run_id, created)
+            for run_id, created in pending
+            if run_id not in committed
+            and (since is None or created >= since)
+            and (until is None or created < until)
+        ]
+        return rows
+
+    def flush(self) -> None:
+        if self._writer is None:
+            return
+        if not self._writer.is_alive():
+            raise StorageError(f"the writer of {self.path} has stopped")
+        done = Event()
+        errors: list[Exception] = []
+        self._queue.put(("flush", done, errors))
+        while not done.wait(1.0):
+            if not self._writer.is_alive():
+                raise StorageError(f"the writer of {self.path} has stopped")
+        if errors:
+            raise StorageError(f"could not write to {self.path}") from errors[0]
+
+    def close(self) -> None:
+        if self._writer is None:
+            return
+        if self._writer.is_alive():
+            self._queue.put(None)
+            self._writer.join()
+        self._connection.close()
+        self._reader.close()
+
+    def _write_loop(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except Empty:
+                    break
+
+            stop = None in batch
+            items = [item for item in batch if item is not None]
+            waiters = [(done, errors) for kind, done, errors in items if kind == "flush"]
+            archived = [archive for kind, _, second in items if kind == "snapshot" for archive in second[1]]
+            try:
+                self._write_batch(items)
+            except Exception as error:
+                logger.exception("Could not write %d queued items to %s", len(items), self.path)
+                with self._pending_lock:
+                    self._unwritten_archives.extend(archived)
+                # Whatever was lost is still in memory; the next full snapshot stores it.
+                self.events_since_snapshot += 1
+                for _, errors in waiters:
+                    errors.append(error)
+            else:
+                with self._pending_lock:
+                    for run_id, payload in archived:
+                        if self._pending_archives.get(run_id) is payload:
+                            del self._pending_archives[run_id]
+            for done, _ in waiters:
+                done.set()
+            if stop:
+                return
+
+    def _write_batch(self, items: list[tuple]) -> None:
+        events = []
+        with self._connection:
+            for kind, first, second in items:
+                if kind == "event":
+                    events.append((first, second))
+                elif kind == "events":
+                    events.extend(first)
+                elif kind == "snapshot":
+                    # Keep log order: write pending events before compacting past them.
+                    self._connection.executemany("INSERT OR REPLACE INTO events VALUES (?, ?)", events)
+                    events = []
+                    rows, archives = second
+                    self._connection.executemany(
+                        "INSERT OR REPLACE INTO archived_runs VALUES (?, strftime('%s', 'now'), ?)", archives
+                    )
+                    self._write_snapshot_rows(first, rows)
+            self._connection.executemany("INSERT OR REPLACE INTO events VALUES (?, ?)", events)
+
+    def _write_snapshot_rows(self, shard_count: int, rows: list[tuple[int, int, int, str]]) -> None:
+        if len(rows) == shard_count:
+            # A full set replaces snapshots taken with another shard count.
+            self._connection.execute("DELETE FROM shard_snapshots WHERE shard_count != ?", (shard_count,))
+            self._connection.execute("DELETE FROM snapshot")
+        self._connection.executemany("INSERT OR REPLACE INTO shard_snapshots VALUES (?, ?, ?, ?)", rows)
+        covered, through_sequence = self._connection.execute(
+            "SELECT COUNT(*), MIN(through_seq) FROM shard_snapshots WHERE shard_count = ?", (shard_count,)
+        ).fetchone()
+        if covered == shard_count:
+            # Every shard's snapshot covers the events up to the oldest one's sequence.
+            self._connection.execute("DELETE FROM events WHERE seq <= ?", (through_sequence,))
+
+
+STORAGE_BACKENDS = {
+    "memory": lambda location: ResultsStorage(),
+    "sqlite": SQLiteStorage,
+}
+
+
+def open_results_storage(spec: str) -> ResultsStorage:
+    """Open a backend from a ``<kind>[:<location>]`` spec such as ``sqlite:data/results.sqlite3``."""
+    kind, _, location = spec.partition(":")
+    try:
+        backend = STORAGE_BACKENDS[kind]
+    except KeyError:
+        raise ValueError(f"Unknown results storage backend: {kind!r}") from None
+    return backend(location)
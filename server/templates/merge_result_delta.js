@@ -0,0 +1,24 @@
+// Included by both teacher pages. Folds one poll's result delta into `polls`;
+// false when that poll isn't loaded, so the caller refetches a full copy.
+function mergeResultDelta(delta) {
+  const poll = polls.find((candidate) => candidate.path === delta.path);
+  if (!poll) {
+    return false;
+  }
+  poll.version = delta.version;
+  poll.total_responses = delta.total_responses;
+  if (delta.counts) {
+    const total = delta.total_responses;
+    poll.options.forEach((option, position) => {
+      option.count = delta.counts[position] || 0;
+      option.percentage = total ? Math.round((option.count / total) * 1000) / 10 : 0;
+    });
+  }
+  if (delta.terms) {
+    poll.terms = delta.terms.map(([term, count]) => ({ term, count }));
+  }
+  if (delta.timeline) {
+    poll.timeline = delta.timeline;
+  }
+  return true;
+}
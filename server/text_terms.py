@@ -0,0 +1,103 @@
+"""Term extraction for the text-answer word cloud.
+
+Answers are lowercased, split into word tokens, filtered through a per-language
+stopword list and reduced with a light suffix-stripping stemmer, so that
+"Linux", "linux " and "I use Linux" all count towards the same term.
+"""
+
+import re
+import unicodedata
+
+TOKEN_PATTERN = re.compile(r"[^\W_]+(?:['’-][^\W_]+)*")
+MIN_STEM_LENGTH = 3
+
+STOPWORDS = {
+    "en": frozenset(
+        """
+        a about above after again against all also am an and any are as at be because been before being
+        below between both but by can could did do does doing down during each few for from further had
+        has have having he her here hers herself him himself his how i if in into is it its itself just
+        me more most my myself no nor not now of off on once only or other our ours ourselves out over
+        own same she should so some such than that the their theirs them themselves then there these
+        they this those through to too under until up use used using very was we were what when where
+        which while who whom why will with would you your yours yourself yourselves i'm it's don't
+        """.split()
+    ),
+    "de": frozenset(
+        """
+        aber alle allem allen aller alles als also am an ander andere anderem anderen anderer anderes auch
+        auf aus bei bin bis bist da damit dann das dass dem den denn der des dich die dies diese diesem
+        diesen dieser dieses dir doch dort du durch ein eine einem einen einer eines er es etwas euch
+        euer eure fuer für hab habe haben hat hatte hier hin ich ihm ihn ihnen ihr ihre im in indem ins
+        ist ja jede jedem jeden jeder jedes kann kein keine keinem keinen man mein meine meinem meinen
+        meiner mich mir mit muss nach nicht nichts noch nun nur ob oder ohne sehr sein seine sich sie
+        sind so solche sondern um und uns unser unter viel vom von vor war waren was weil welche wenn
+        wer werde werden wie wir wird wo zu zum zur zwischen
+        """.split()
+    ),
+    "it": frozenset(
+        """
+        a ad al alla alle allo agli ai anche avere c che chi ci coi col come con contro cui da dal dalla
+        dalle dallo dagli dai degli dei del della delle dello di dove e ed era erano essere gli ha hai
+        hanno ho i il in io l la le lei li lo loro lui ma mi mia mie miei mio ne negli nei nel nella
+        nelle nello noi non nostra nostre nostri nostro o per perche perché piu più quale quando quella
+        quelle quelli quello questa queste questi questo se sei si sia siamo sono su sua sue sui sul
+        sulla sulle suo suoi ti tra tu tua tue tuo tuoi tutti tutto un una uno usa uso vi voi
+        """.split()
+    ),
+}
+
+# Longest suffix first; each list is tried once per token.
+SUFFIXES = {
+    "en": ("ations", "ation", "ings", "ies", "ing", "ed", "es", "s"),
+    "de": ("ungen", "ern", "em", "en", "er", "es", "e", "n", "s"),
+    "it": ("zioni", "zione", "mente", "i", "e", "a", "o"),
+}
+
+
+def fold_accents(token: str) -> str:
+    if token.isascii():
+        return token
+    decomposed = unicodedata.normalize("NFKD", token.replace("ß", "ss"))
+    return "".join(char for char in decomposed if not unicodedata.combining(char))
+
+
+# German only drops a plural/genitive "s" after these letters (as in Snowball).
+GERMAN_S_ENDINGS = frozenset("bdfghklmnrt")
+
+
+def stem(token: str, language: str) -> str:
+    if token.isdigit():
+        return token
+    for suffix in SUFFIXES.get(language, SUFFIXES["en"]):
+        if not token.endswith(suffix) or len(token) - len(suffix) < MIN_STEM_LENGTH:
+            continue
+        base = token[: -len(suffix)]
+        if language == "en":
+            if suffix == "s" and token.endswith(("ss", "us", "is")):
+                continue
+            if suffix == "ies":
+                return base + "y"
+            if suffix in {"ing", "ed"} and base[-1] == base[-2] and base[-1] not in "lsz":
+                return base[:-1]
+        elif language == "de" and suffix == "s" and base[-1] not in GERMAN_S_ENDINGS:
+            continue
+        return base
+    return token
+
+
+def extract_terms(text: str, language: str = "en") -> dict[str, str]:
+    """Return ``{stem: surface form}`` for the distinct terms in ``text``.
+
+    Each term is counted once per answer, so the cloud shows how many students
+    mentioned it rather than how often one essay repeated it.
+    """
+    stopwords = STOPWORDS.get(language, STOPWORDS["en"])
+    terms: dict[str, str] = {}
+    for match in TOKEN_PATTERN.finditer(text.lower()):
+        token = match.group()
+        if token in stopwords or (len(token) < 2 and not token.isdigit()):
+            continue
+        term = stem(fold_accents(token), language)
+        terms.setdefault(term, token)
+    return terms
@@ -0,0 +1,105 @@
+"""How fast answers to one poll arrive, second by second.
+
+Each poll of a run that gets answers live keeps a ring of per-second counts
+covering its last ``seconds`` seconds: first answers in one ring, changed
+answers in another, allocated with the first changed answer. Recording an
+answer touches one slot (plus clearing the slots of seconds that passed
+without answers), so memory per poll is fixed however long the run stays open.
+"""
+
+from array import array
+from bisect import bisect_left
+from itertools import accumulate
+from math import ceil
+
+# Slots are unsigned shorts; a single second never sees anywhere near this many answers.
+MAX_SLOT_COUNT = 0xFFFF
+
+
+class SubmissionTimeline:
+    __slots__ = ("first", "last", "responses", "dropped", "answers", "changes")
+
+    def __init__(self, seconds: int, now: int) -> None:
+        self.first = now  # second of the first answer
+        self.last = now  # second of the latest answer
+        self.responses = 0  # first answers recorded
+        self.dropped = 0  # first answers in seconds that have left the ring
+        self.answers = array("H", bytes(2 * seconds))
+        # Most polls never see a changed answer.
+        self.changes: array | None = None
+
+    def record(self, now: int, changed: bool) -> None:
+        size = len(self.answers)
+        if now > self.last:
+            # Seconds since the latest answer had none; their slots still hold
+            # counts from one ring ago, which now leave the window.
+            for second in range(max(self.last + 1, now - size + 1), now + 1):
+                slot = second % size
+                self.dropped += self.answers[slot]
+                self.answers[slot] = 0
+                if self.changes is not None:
+                    self.changes[slot] = 0
+            self.last = now
+        # A clock that stepped back counts into the latest second.
+        slot = self.last % size
+        if changed:
+            if self.changes is None:
+                self.changes = array("H", bytes(2 * size))
+            self.changes[slot] = min(self.changes[slot] + 1, MAX_SLOT_COUNT)
+        else:
+            self.answers[slot] = min(self.answers[slot] + 1, MAX_SLOT_COUNT)
+            self.responses += 1
+
+    def copy(self) -> "SubmissionTimeline":
+        copied = SubmissionTimeline.__new__(SubmissionTimeline)
+        copied.first, copied.last, copied.responses, copied.dropped = self.first, self.last, self.responses, self.dropped
+        copied.answers = self.answers[:]
+        copied.changes = self.changes[:] if self.changes is not None else None
+        return copied
+
+    def window(self) -> range:
+        """The seconds still in the ring, oldest first."""
+        return range(max(self.first, self.last - len(self.answers) + 1), self.last + 1)
+
+    def chronological(self, ring: array) -> array:
+        """``ring``'s counts for the seconds in ``window()``, oldest first."""
+        size = len(ring)
+        seconds = len(self.window())
+        end = self.last % size + 1
+        ordered = ring[end:] + ring[:end]
+        return ordered[size - seconds :]
+
+    def time_to_share(self, share: float) -> int | None:
+        """Seconds from the first answer until ``share`` of the first answers were in.
+
+        ``None`` if that point has already left the ring.
+        """
+        needed = ceil(self.responses * share)
+        if not needed or self.dropped >= needed:
+            return None
+        received = list(accumulate(self.chronological(self.answers), initial=self.dropped))
+        position = bisect_left(received, needed, lo=1)
+        if position == len(received):
+            return None
+        return self.window()[position - 1] - self.first
+
+    def summary(self, points: int, share: float) -> dict:
+        """A sparkline of at most ``points`` buckets ending at the latest answer, and time to ``share``.
+
+        Everything is relative to the latest answer, so the summary only
+        changes with a new answer; clients pad the time since ``end`` with zeros.
+        """
+        answers = self.chronological(self.answers)
+        changes = self.chronological(self.changes) if self.changes is not None else array("H", bytes(2 * len(answers)))
+        step = max(1, ceil(len(answers) / points))
+        # Buckets are aligned to end at the latest second; the first may be partial.
+        edges = range(len(answers), 0, -step)
+        return {
+            "end": self.last,
+            "step": step,
+            "answers": [sum(answers[max(0, edge - step) : edge]) for edge in reversed(edges)],
+            "changes": [sum(changes[max(0, edge - step) : edge]) for edge in reversed(edges)],
+            "first": self.first,
+            "share": share,
+            "time_to_share": self.time_to_share(share),
+        }